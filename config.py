@@ -1,7 +1,9 @@
 import os
-from dotenv import load_dotenv, find_dotenv
+from dotenv import load_dotenv
 
-load_dotenv(find_dotenv())
+# The .env file is looked up next to this file only: find_dotenv() walks the call stack
+# and parent directories on every start.
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 
 TESTING = True
 DEBUG = True
@@ -10,13 +12,38 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-username = os.environ.get('DB_USERNAME')
-password = os.environ.get('DB_PASSWORD')
+CAPTURE_LOG = os.environ.get('CAPTURE_LOG')
 
-url = 'localhost'
-if 'DB_PORT' in os.environ:
-    url += ':' + os.environ.get('DB_PORT')
+# Directory for request profiles. Requests with an X-Profile-Request header are profiled, and
+# a PROFILE_SAMPLE_RATE share of the others.
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
 
-name = os.environ.get('DB_NAME')
+# Flush window of group commit in milliseconds; writes are committed one by one when it's not set.
+GROUP_COMMIT_WINDOW = os.environ.get('GROUP_COMMIT_WINDOW')
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 100))
 
-SQLALCHEMY_DATABASE_URI = f'postgresql://{username}:{password}@{url}/{name}'
+# Extra databases to spread orders over by region, as a comma-separated list of URIs. The main
+# database is shard 0, and region r goes to shard r % number of shards unless it is pinned to
+# another one with DB_SHARD_REGIONS="r:shard,...".
+SHARD_DATABASE_URIS = [uri for uri in os.environ.get('DB_SHARDS', '').split(',') if uri]
+SHARD_REGION_MAP = {int(region): int(shard) for region, shard in
+                    (pair.split(':') for pair in os.environ.get('DB_SHARD_REGIONS', '').split(',') if pair)}
+# Number of requests whose reads can fan out to the shards at the same time.
+SHARD_CONCURRENT_REQUESTS = int(os.environ.get('DB_SHARD_CONCURRENT_REQUESTS', 32))
+
+DB_BACKEND = os.environ.get('DB_BACKEND', 'postgresql')
+
+if DB_BACKEND == 'sqlite':
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.environ.get('DB_PATH', ':memory:')
+else:
+    username = os.environ.get('DB_USERNAME')
+    password = os.environ.get('DB_PASSWORD')
+
+    url = 'localhost'
+    if 'DB_PORT' in os.environ:
+        url += ':' + os.environ.get('DB_PORT')
+
+    name = os.environ.get('DB_NAME')
+
+    SQLALCHEMY_DATABASE_URI = f'postgresql://{username}:{password}@{url}/{name}'
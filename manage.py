@@ -1,15 +1,161 @@
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 
+import sys
+import contextlib
+
 from src.models import db
-from src.app import app
+from src.app import create_app, load_config
+from src.replay import HttpTarget, InProcessTarget, replay_capture_log
+from src.startup_profile import profile_startup, format_startup_report
+from src.storage import get_storage
+from src.archiver import archive_orders, run_archiver
+from src.reports import courier_report, REPORT_FORMATS
+from src.request_profile import read_profiles, format_profile_list, aggregate_profiles
+from src.sharding import ShardedStorage, rebalance as rebalance_shards
+from src.shard_benchmark import benchmark_shards
+from src.commit_benchmark import benchmark_group_commit
+from src.poll_benchmark import benchmark_long_poll
 
+app = create_app()
 migrate = Migrate(app, db)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('log_path', help='Capture log written with CAPTURE_LOG set')
+@manager.option('-u', '--url', dest='url', default=None,
+                help='Server to replay against, the in-process application is used by default')
+@manager.option('-s', '--speed', dest='speed', type=float, default=1.0,
+                help='Speed-up factor relative to the original timing, 0 replays as fast as possible')
+@manager.option('-c', '--clients', dest='clients', type=int, default=1, help='Number of concurrent clients')
+def replay(log_path, url, speed, clients):
+    """Replay captured traffic and report latencies and response mismatches"""
+    if url:
+        target = HttpTarget(url)
+    else:
+        # The in-process application always starts from an empty in-memory database, never the
+        # configured one. Its single connection can't be shared by concurrent requests.
+        config = load_config()
+        config.update({
+            'DB_BACKEND': 'sqlite',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'SQLALCHEMY_ENGINE_OPTIONS': {},
+            'SHARD_DATABASE_URIS': [],
+            'CAPTURE_LOG': None
+        })
+        target = InProcessTarget(create_app(config), serialize=True)
+
+    print(replay_capture_log(log_path, target, speed=speed, concurrency=clients))
+
+
+class StartupProfile(Command):
+    """Report import times and time to first request of a fresh application"""
+
+    option_list = (
+        Option('-t', '--top', dest='top', type=int, default=20, help='Number of slowest imports to show'),
+        Option('-b', '--budget', dest='budget', type=float, default=None,
+               help='Fail if time to first request exceeds this many milliseconds'),
+    )
+
+    def run(self, top, budget):
+        timings = profile_startup()
+        print(format_startup_report(timings, top=top))
+
+        total = (timings['create_app'] + timings['first_request']) * 1000
+        if budget is not None and total > budget:
+            print(f'\nStartup took {total:.1f} ms, over the budget of {budget:.1f} ms')
+            sys.exit(1)
+
+
+manager.add_command('startup-profile', StartupProfile())
+
+
+@manager.option('-f', '--format', dest='report_format', default='csv', choices=list(REPORT_FORMATS))
+@manager.option('-o', '--output', dest='output', default=None, help='File to write, standard output by default')
+def report_couriers(report_format, output):
+    """Write the rating and earnings of every courier"""
+    format_report = REPORT_FORMATS[report_format][0]
+    with (open(output, 'w', newline='') if output else contextlib.nullcontext(sys.stdout)) as file:
+        file.writelines(format_report(courier_report(get_storage())))
+
+
+@manager.option('-d', '--directory', dest='directory', default=None, help='Profile directory, PROFILE_DIR by default')
+@manager.option('-e', '--endpoint', dest='endpoint', default=None, help='Only profiles of e.g. "POST /orders/assign"')
+@manager.option('-a', '--aggregate', dest='aggregate', action='store_true', help='Print the combined profile')
+@manager.option('-s', '--sort', dest='sort', default='cumulative', help='pstats sort key for --aggregate')
+@manager.option('-t', '--top', dest='top', type=int, default=30, help='Number of functions shown by --aggregate')
+def profiles(directory, endpoint, aggregate, sort, top):
+    """List captured request profiles or aggregate them"""
+    directory = directory or app.config.get('PROFILE_DIR')
+    if not directory:
+        print('No profile directory, set PROFILE_DIR or pass --directory')
+        return
+
+    captured = read_profiles(directory, endpoint=endpoint)
+    if not captured:
+        print('No profiles captured')
+    elif aggregate:
+        print(aggregate_profiles(captured, sort=sort, top=top))
+    else:
+        print(format_profile_list(captured))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000,
+                help='Number of orders moved per transaction')
+@manager.option('-i', '--interval', dest='interval', type=float, default=None,
+                help='Keep running and archive every INTERVAL seconds')
+def archive(batch_size, interval):
+    """Move delivered orders from the orders table to the archive"""
+    if interval:
+        run_archiver(get_storage(), batch_size=batch_size, interval=interval)
+    else:
+        print(f'Archived {archive_orders(get_storage(), batch_size=batch_size)} delivered orders')
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000,
+                help='Number of orders moved per transaction')
+def rebalance(batch_size):
+    """Move orders to the shards their regions are mapped to and copy couriers to every shard"""
+    storage = get_storage()
+    if not isinstance(storage, ShardedStorage):
+        print('Sharding is not configured, set DB_SHARDS to use it')
+        return
+
+    print(f'Moved {rebalance_shards(storage.router, batch_size=batch_size)} orders')
+
+
+@manager.option('-s', '--max-shards', dest='max_shards', type=int, default=4)
+@manager.option('-o', '--orders', dest='orders', type=int, default=5000)
+@manager.option('-c', '--couriers', dest='couriers', type=int, default=200)
+@manager.option('-n', '--clients', dest='clients', type=int, default=8, help='Number of concurrent clients')
+def benchmark_sharding(max_shards, orders, couriers, clients):
+    """Measure order import and assignment throughput on 1 to N SQLite shards"""
+    benchmark_shards(max_shards=max_shards, orders=orders, couriers=couriers, clients=clients)
+
+
+@manager.option('-w', '--writes', dest='writes', type=int, default=2000)
+@manager.option('-n', '--clients', dest='clients', type=int, default=16, help='Number of concurrent clients')
+@manager.option('-d', '--directory', dest='directory', default=None,
+                help='Directory for the benchmark databases, on the disk to measure')
+def benchmark_group_commit_windows(writes, clients, directory):
+    """Measure order write throughput and latency without group commit and at several flush windows"""
+    benchmark_group_commit(writes=writes, clients=clients, directory=directory)
+
+
+@manager.option('-n', '--couriers', dest='couriers', type=int, default=100, help='Number of waiting couriers')
+@manager.option('-d', '--duration', dest='duration', type=float, default=20, help='Seconds per mode')
+@manager.option('-o', '--order-interval', dest='order_interval', type=float, default=0.1,
+                help='Seconds between new orders')
+@manager.option('-p', '--poll-interval', dest='poll_interval', type=float, default=2,
+                help='Seconds between polls of a courier without orders')
+def benchmark_long_poll_assign(couriers, duration, order_interval, poll_interval):
+    """Compare database load and pickup delay of polling and long-polling couriers"""
+    benchmark_long_poll(couriers=couriers, duration=duration, order_interval=order_interval,
+                        poll_interval=poll_interval)
+
+
 if __name__ == '__main__':
     manager.run()
     db.create_all()
@@ -1,21 +1,48 @@
-from src.models import db
-from src.url_handlers import Couriers, CouriersId, Orders, OrdersAssign, OrdersComplete
-
 import os
 
 from flask import Flask
-from flask_restful import Api
+from flask.config import Config
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_config():
+    config = Config(ROOT_PATH)
+    config.from_pyfile(os.path.join(ROOT_PATH, 'config.py'))
+    return config
+
+
+def create_app(config=None):
+    # Handlers and database extensions are imported here rather than at module level, so
+    # importing this module stays cheap for tools that only need the factory.
+    from src.models import db
+    from src.storage import init_storage
+    from src.sharding import init_sharding
+    from src.group_commit import init_group_commit
+    from src.notifier import init_notifier
+    from src.capture import init_capture
+    from src.request_profile import init_request_profiling
+    from src.url_handlers import Couriers, CouriersId, Orders, OrdersAssign, OrdersComplete, CouriersReport
 
+    from flask_restful import Api
 
-app = Flask(__name__)
+    app = Flask(__name__)
+    app.config.from_mapping(load_config() if config is None else config)
 
-app.config.from_pyfile(os.path.join(os.path.dirname(app.instance_path), 'config.py'))
-db.init_app(app)
-api = Api(app)
+    db.init_app(app)
+    init_storage(app)
+    init_sharding(app)
+    init_group_commit(app)
+    init_notifier(app)
+    init_capture(app)
+    init_request_profiling(app)
+    api = Api(app)
 
+    api.add_resource(Couriers, '/couriers')
+    api.add_resource(CouriersId, '/couriers/<int:courier_id>')
+    api.add_resource(Orders, '/orders')
+    api.add_resource(OrdersAssign, '/orders/assign')
+    api.add_resource(OrdersComplete, '/orders/complete')
+    api.add_resource(CouriersReport, '/reports/couriers')
 
-api.add_resource(Couriers, '/couriers')
-api.add_resource(CouriersId, '/couriers/<int:courier_id>')
-api.add_resource(Orders, '/orders')
-api.add_resource(OrdersAssign, '/orders/assign')
-api.add_resource(OrdersComplete, '/orders/complete')
+    return app
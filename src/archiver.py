@@ -0,0 +1,21 @@
+import time
+
+
+def archive_orders(storage, batch_size=1000):
+    # Every batch is committed on its own to keep transactions and row locks short.
+    archived = 0
+    while True:
+        count = storage.archive_delivered_orders(batch_size)
+        storage.commit()
+        archived += count
+
+        if count < batch_size:
+            return archived
+
+
+def run_archiver(storage, batch_size=1000, interval=60, log=print):
+    while True:
+        archived = archive_orders(storage, batch_size)
+        if archived:
+            log(f'Archived {archived} delivered orders')
+        time.sleep(interval)
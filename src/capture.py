@@ -0,0 +1,55 @@
+import json
+import time
+import threading
+
+from flask import request
+
+
+class CaptureLog:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', buffering=1)
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def read_capture_log(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def init_capture(app):
+    path = app.config.get('CAPTURE_LOG')
+    if not path:
+        return
+
+    capture_log = CaptureLog(path)
+    app.extensions['capture_log'] = capture_log
+
+    @app.before_request
+    def start_capture():
+        # The body is parsed separately from request.json, which handlers may modify in place.
+        request.environ['capture.start_time'] = time.time()
+        try:
+            request.environ['capture.body'] = json.loads(request.get_data() or 'null')
+        except ValueError:
+            request.environ['capture.body'] = None
+
+    @app.after_request
+    def capture_response(response):
+        capture_log.write({
+            'time': request.environ['capture.start_time'],
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'body': request.environ['capture.body'],
+            'status': response.status_code,
+            'response': None if response.is_streamed else response.get_json(force=True, silent=True)
+        })
+        return response
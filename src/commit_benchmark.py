@@ -0,0 +1,54 @@
+from src.app import create_app
+from src.models import db
+from src.replay import percentile
+
+import os
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import QueuePool
+
+
+def create_benchmark_app(path, window, clients):
+    app = create_app({
+        'DB_BACKEND': 'sqlite',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': QueuePool,
+            'pool_size': clients + 1,
+            'connect_args': {'timeout': 60, 'check_same_thread': False}
+        },
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'GROUP_COMMIT_WINDOW': window,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def run_writes(app, clients, writes):
+    def send(order_id):
+        start = time.perf_counter()
+        app.test_client().post('/orders', json={'data': [{
+            'order_id': order_id,
+            'weight': 1,
+            'region': order_id % 10 + 1,
+            'delivery_hours': ['09:00-18:00']
+        }]}).get_data()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = sorted(executor.map(send, range(1, writes + 1)))
+    return time.perf_counter() - start, latencies
+
+
+def benchmark_group_commit(windows=(None, 0, 1, 2, 5, 10), writes=2000, clients=16, directory=None, log=print):
+    log(f'{"window ms":>10}{"writes/s":>12}{"p50 ms":>10}{"p99 ms":>10}')
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        for window in windows:
+            path = os.path.join(directory, f'window-{window}.db')
+            elapsed, latencies = run_writes(create_benchmark_app(path, window, clients), clients, writes)
+            log(f'{"off" if window is None else window:>10}{writes / elapsed:>12.1f}'
+                f'{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}')
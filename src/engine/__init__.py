@@ -0,0 +1,5 @@
+from src.engine.time_windows import TimeWindowSet, as_time_windows
+from src.engine.records import Courier, Order
+from src.engine.rules import time_ranges_intersect, intersect, can_carry, fits_courier, \
+    count_delivery_time, calculate_rating, rating_for_average_times, calculate_earnings
+from src.engine.dispatcher import Dispatcher, DispatchError
@@ -0,0 +1,148 @@
+from src.engine.records import Courier, Order
+from src.engine.rules import intersect, can_carry, fits_courier, count_delivery_time, \
+    calculate_rating, calculate_earnings
+
+
+class DispatchError(Exception):
+    pass
+
+
+class Dispatcher:
+    def __init__(self):
+        self.couriers = {}
+        self.orders = {}
+
+        self.unassigned_by_region = {}
+        self.remaining_by_courier = {}
+        self.delivered_by_courier = {}
+        self.batch_delivery_times = {}
+
+    def add_courier(self, courier_id, courier_type, regions, working_hours):
+        if courier_id in self.couriers:
+            self._detach_courier_orders(courier_id)
+
+        courier = Courier(courier_id, courier_type, regions, working_hours)
+        self.couriers[courier_id] = courier
+        self.remaining_by_courier[courier_id] = {}
+        self.delivered_by_courier[courier_id] = []
+        return courier
+
+    def patch_courier(self, courier_id, courier_type=None, regions=None, working_hours=None):
+        old_courier = self.get_courier(courier_id)
+        courier = Courier(
+            courier_id,
+            old_courier.courier_type if courier_type is None else courier_type,
+            old_courier.regions if regions is None else regions,
+            old_courier.working_hours if working_hours is None else working_hours
+        )
+        self.couriers[courier_id] = courier
+
+        remaining_orders = self.remaining_by_courier[courier_id]
+        for order in list(remaining_orders.values()):
+            if not fits_courier(order, courier):
+                del remaining_orders[order.order_id]
+                self._unassign(order)
+
+        return courier
+
+    def get_courier(self, courier_id):
+        if courier_id not in self.couriers:
+            raise DispatchError('No courier with provided id found')
+        return self.couriers[courier_id]
+
+    def add_order(self, order_id, weight, region, delivery_hours):
+        if order_id in self.orders:
+            self._remove_order(self.orders[order_id])
+
+        order = Order(order_id, weight, region, delivery_hours)
+        self.orders[order_id] = order
+        self._unassign(order)
+        return order
+
+    def get_order(self, order_id):
+        if order_id not in self.orders:
+            raise DispatchError('No order with provided id found')
+        return self.orders[order_id]
+
+    def get_remaining_orders(self, courier_id):
+        return list(self.remaining_by_courier[courier_id].values())
+
+    def get_suitable_orders(self, courier_id):
+        courier = self.get_courier(courier_id)
+        suitable_orders = []
+        for region in set(courier.regions):
+            for order in self.unassigned_by_region.get(region, {}).values():
+                if can_carry(courier, order) and intersect(order.delivery_hours, courier.working_hours):
+                    suitable_orders.append(order)
+        return suitable_orders
+
+    def assign_orders(self, courier_id, current_time):
+        courier = self.get_courier(courier_id)
+        remaining_orders = self.remaining_by_courier[courier_id]
+
+        if not remaining_orders:
+            for order in self.get_suitable_orders(courier_id):
+                del self.unassigned_by_region[order.region][order.order_id]
+                order.assigned_courier_id = courier_id
+                order.assigned_courier_type = courier.courier_type
+                order.assigned_time = current_time
+                remaining_orders[order.order_id] = order
+
+        return list(remaining_orders.values())
+
+    def complete_order(self, courier_id, order_id, complete_time):
+        self.get_courier(courier_id)
+        order = self.get_order(order_id)
+
+        if order.assigned_courier_id != courier_id:
+            raise DispatchError('This order is not assigned to given courier')
+
+        if order.delivery_time is None:
+            batch = (courier_id, order.assigned_time)
+            batch_delivery_times = self.batch_delivery_times.get(batch)
+            delivery_time = count_delivery_time(order.assigned_time, complete_time,
+                                                [batch_delivery_times] if batch_delivery_times else [])
+
+            if delivery_time < 0:
+                raise DispatchError('Negative delivery time')
+
+            order.delivery_time = delivery_time
+            self.batch_delivery_times[batch] = max(delivery_time, batch_delivery_times or 0)
+            del self.remaining_by_courier[courier_id][order_id]
+            self.delivered_by_courier[courier_id].append(order)
+
+        return order
+
+    def get_rating(self, courier_id):
+        return calculate_rating(self.delivered_by_courier[courier_id])
+
+    def get_earnings(self, courier_id):
+        return calculate_earnings(self.delivered_by_courier[courier_id])
+
+    def _unassign(self, order):
+        order.assigned_courier_id = None
+        order.assigned_courier_type = None
+        order.assigned_time = None
+        self.unassigned_by_region.setdefault(order.region, {})[order.order_id] = order
+
+    def _remove_order(self, order):
+        del self.orders[order.order_id]
+
+        if order.assigned_time is None:
+            del self.unassigned_by_region[order.region][order.order_id]
+        elif order.assigned_courier_id is not None:
+            if order.delivery_time is None:
+                del self.remaining_by_courier[order.assigned_courier_id][order.order_id]
+            else:
+                self.delivered_by_courier[order.assigned_courier_id].remove(order)
+
+    def _detach_courier_orders(self, courier_id):
+        # Replacing a courier keeps its orders assigned but no longer linked to anybody,
+        # the same way deleting the courier row nulls the foreign key in the database.
+        for order in self.remaining_by_courier.pop(courier_id).values():
+            order.assigned_courier_id = None
+        for order in self.delivered_by_courier.pop(courier_id):
+            order.assigned_courier_id = None
+
+        for batch in [batch for batch in self.batch_delivery_times if batch[0] == courier_id]:
+            del self.batch_delivery_times[batch]
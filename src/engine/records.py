@@ -0,0 +1,33 @@
+from src.engine.time_windows import as_time_windows
+
+
+class Courier:
+    __slots__ = ('courier_id', 'courier_type', 'regions', 'working_hours')
+
+    def __init__(self, courier_id, courier_type, regions, working_hours):
+        self.courier_id = courier_id
+        self.courier_type = courier_type
+        self.regions = tuple(regions)
+        self.working_hours = as_time_windows(working_hours)
+
+    def __repr__(self):
+        return '<Courier id {}>'.format(self.courier_id)
+
+
+class Order:
+    __slots__ = ('order_id', 'weight', 'region', 'delivery_hours',
+                 'assigned_courier_id', 'assigned_courier_type', 'assigned_time', 'delivery_time')
+
+    def __init__(self, order_id, weight, region, delivery_hours):
+        self.order_id = order_id
+        self.weight = weight
+        self.region = region
+        self.delivery_hours = as_time_windows(delivery_hours)
+
+        self.assigned_courier_id = None
+        self.assigned_courier_type = None
+        self.assigned_time = None
+        self.delivery_time = None
+
+    def __repr__(self):
+        return '<Order id {}>'.format(self.order_id)
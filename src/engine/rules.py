@@ -0,0 +1,62 @@
+from src.business_data import MAX_LOAD_CAPACITY, BASE_ORDER_PAYMENT, EARNINGS_COEFFICIENTS
+from src.engine.time_windows import as_time_windows
+
+# The rules below only read attributes, so they accept both the engine records and
+# the ORM models: couriers need courier_type, regions and working_hours, orders need
+# weight, region, delivery_hours, assigned_courier_type and delivery_time.
+
+
+def time_ranges_intersect(range1, range2):
+    return (
+        (range1[1] < range1[0] and range2[1] < range2[0]) or
+        (range1[0] <= range2[1] and range2[0] <= range1[1]) or
+        (range1[1] < range1[0] <= range2[1]) or
+        (range2[0] <= range1[1] < range1[0]) or
+        (range1[0] <= range2[1] < range2[0]) or
+        (range2[1] < range2[0] <= range1[1])
+    )
+
+
+def intersect(hours1, hours2):
+    return as_time_windows(hours1).intersects(as_time_windows(hours2))
+
+
+def can_carry(courier, order):
+    return order.weight <= MAX_LOAD_CAPACITY[courier.courier_type]
+
+
+def fits_courier(order, courier):
+    return can_carry(courier, order) and \
+           order.region in courier.regions and \
+           intersect(order.delivery_hours, courier.working_hours)
+
+
+def count_delivery_time(assigned_time, complete_time, batch_delivery_times):
+    # Delivery of the next order in a batch starts once the previous one is delivered,
+    # so the start is shifted by the longest delivery time seen in the batch so far.
+    delivery_start = assigned_time
+    if batch_delivery_times:
+        delivery_start += max(batch_delivery_times)
+
+    return complete_time - delivery_start
+
+
+def calculate_rating(delivered_orders):
+    delivery_times = {}
+    for order in delivered_orders:
+        if order.region in delivery_times:
+            delivery_times[order.region].append(order.delivery_time)
+        else:
+            delivery_times[order.region] = [order.delivery_time]
+
+    return rating_for_average_times([sum(times) // len(times) for times in delivery_times.values()])
+
+
+def rating_for_average_times(average_times):
+    t = min(average_times)
+
+    return (60 * 60 - min(t, 60 * 60)) / (60 * 60) * 5
+
+
+def calculate_earnings(delivered_orders):
+    return sum([BASE_ORDER_PAYMENT * EARNINGS_COEFFICIENTS[order.assigned_courier_type] for order in delivered_orders])
@@ -0,0 +1,88 @@
+MINUTES_IN_DAY = 24 * 60
+
+
+def parse_time_interval(time_interval):
+    # Intervals are validated as 'HH:MM-HH:MM' before they get here.
+    return [int(time_interval[0:2]) * 60 + int(time_interval[3:5]),
+            int(time_interval[6:8]) * 60 + int(time_interval[9:11])]
+
+
+def format_minutes(minutes):
+    return f'{minutes // 60:02}:{minutes % 60:02}'
+
+
+def normalize(periods):
+    # Periods are closed ranges of minutes, an end before the start wraps past midnight.
+    windows = []
+    for start, end in periods:
+        if end < start:
+            windows.append((start, MINUTES_IN_DAY - 1))
+            windows.append((0, end))
+        else:
+            windows.append((start, end))
+    windows.sort()
+
+    merged = []
+    for start, end in windows:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+# Working or delivery hours. The periods are kept as they were given, for storage and responses,
+# next to the sorted disjoint windows within one day that matching works with.
+class TimeWindowSet:
+    __slots__ = ('periods', 'windows', '_time_intervals')
+
+    def __init__(self, periods=(), time_intervals=None):
+        self.periods = tuple((start, end) for start, end in periods)
+        self.windows = normalize(self.periods)
+        self._time_intervals = time_intervals
+
+    @classmethod
+    def parse(cls, time_intervals):
+        time_intervals = tuple(time_intervals)
+        return cls([parse_time_interval(time_interval) for time_interval in time_intervals], time_intervals)
+
+    @property
+    def time_intervals(self):
+        if self._time_intervals is None:
+            self._time_intervals = tuple(f'{format_minutes(start)}-{format_minutes(end)}'
+                                         for start, end in self.periods)
+        return self._time_intervals
+
+    def intersects(self, other):
+        windows1, windows2 = self.windows, other.windows
+        i = j = 0
+        while i < len(windows1) and j < len(windows2):
+            start1, end1 = windows1[i]
+            start2, end2 = windows2[j]
+            if start1 <= end2 and start2 <= end1:
+                return True
+            if end1 < end2:
+                i += 1
+            else:
+                j += 1
+        return False
+
+    def __iter__(self):
+        return iter(self.periods)
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __eq__(self, other):
+        return isinstance(other, TimeWindowSet) and self.periods == other.periods
+
+    def __hash__(self):
+        return hash(self.periods)
+
+    def __repr__(self):
+        return 'TimeWindowSet({})'.format(list(self.time_intervals))
+
+
+def as_time_windows(periods):
+    return periods if isinstance(periods, TimeWindowSet) else TimeWindowSet(periods)
@@ -0,0 +1,137 @@
+from src.storage import get_storage
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+# Seconds a request waits for its writes to be committed.
+WRITE_TIMEOUT = 30
+
+
+# Adds a row, replacing the one with the same id only if it was known to exist beforehand. A row
+# added by a concurrent request in the meantime makes the insert conflict, and it is then retried
+# as a replacement.
+class InsertOrReplace:
+    def __init__(self, add, replace):
+        self.add = add
+        self.replace = replace
+
+    def __call__(self, storage):
+        self.add(storage, self.replace)
+
+
+def apply(storage, operation):
+    try:
+        operation(storage)
+        storage.commit()
+    except IntegrityError:
+        if not isinstance(operation, InsertOrReplace) or operation.replace:
+            raise
+        storage.rollback()
+        operation.add(storage, True)
+        storage.commit()
+
+
+class GroupCommitter:
+    def __init__(self, app, window, max_batch=100):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='group-committer', daemon=True)
+        self.thread.start()
+
+    def submit(self, operation):
+        future = Future()
+        self.queue.put((operation, future))
+        return future
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        storage = get_storage()
+        try:
+            for operation, _ in batch:
+                operation(storage)
+            storage.commit()
+        except Exception:
+            storage.rollback()
+            # A write that fails must not fail the others flushed with it, so the batch is
+            # retried one write per transaction.
+            for operation, future in batch:
+                try:
+                    apply(storage, operation)
+                except Exception as error:
+                    storage.rollback()
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+        else:
+            for _, future in batch:
+                future.set_result(None)
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                batch = self.collect()
+                try:
+                    self.flush(batch)
+                except Exception as error:
+                    # A rollback that fails too, after a dropped connection for one, must neither stop
+                    # the only committer nor leave the requests of the batch waiting.
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    try:
+                        get_storage().release()
+                    except Exception:
+                        pass
+
+
+def init_group_commit(app):
+    window = app.config.get('GROUP_COMMIT_WINDOW')
+    if window is None:
+        return
+
+    app.extensions['group_committer'] = GroupCommitter(
+        app, window=float(window) / 1000, max_batch=int(app.config.get('GROUP_COMMIT_MAX_BATCH', 100))
+    )
+
+
+# Operations are functions of the storage. With group commit enabled they are flushed together
+# with the writes of concurrent requests, and this returns once their transaction is committed.
+def write(*operations):
+    committer = current_app.extensions.get('group_committer')
+    storage = get_storage()
+
+    if committer is None:
+        # The operations are committed in one transaction, and only an insert conflicting with one
+        # of a concurrent request makes them retried one write per transaction.
+        try:
+            for operation in operations:
+                operation(storage)
+            storage.commit()
+        except IntegrityError:
+            storage.rollback()
+            for operation in operations:
+                apply(storage, operation)
+        return
+
+    deadline = time.monotonic() + WRITE_TIMEOUT
+    for future in [committer.submit(operation) for operation in operations]:
+        future.result(timeout=max(0, deadline - time.monotonic()))
+    # The writes were made in the committer's session, objects loaded by this request are stale.
+    storage.refresh()
@@ -104,3 +104,17 @@ order_complete_schema = {
     'required': ['courier_id', 'order_id', 'complete_time'],
     'additionalProperties': False
 }
+
+validators = {}
+
+
+def validation_error(instance, schema):
+    # jsonschema is one of the slowest imports of the application, so it is loaded on the
+    # first validation instead of at startup, and each schema is compiled only once.
+    import jsonschema
+
+    if id(schema) not in validators:
+        validators[id(schema)] = jsonschema.validators.validator_for(schema)(schema)
+
+    error = jsonschema.exceptions.best_match(validators[id(schema)].iter_errors(instance))
+    return None if error is None else error.message
@@ -0,0 +1,51 @@
+from src.storage import get_storage
+
+from flask import g
+
+# Couriers and orders looked up by id are kept for the rest of the request, including the ids
+# that were not found. The cached objects belong to the request's session, so writes expire them
+# and they are reloaded on the next access rather than served stale.
+
+
+def request_cache(name):
+    if 'lookups' not in g:
+        g.lookups = {}
+    return g.lookups.setdefault(name, {})
+
+
+def get_many(name, ids, load, id_of):
+    cache = request_cache(name)
+    missing_ids = [id_ for id_ in dict.fromkeys(ids) if id_ not in cache]
+    if missing_ids:
+        cache.update(dict.fromkeys(missing_ids))
+        cache.update({id_of(row): row for row in load(missing_ids)})
+    return {id_: cache[id_] for id_ in ids}
+
+
+def get_couriers(courier_ids):
+    return get_many('couriers', courier_ids, get_storage().get_couriers, lambda courier: courier.courier_id)
+
+
+def get_orders(order_ids):
+    return get_many('orders', order_ids, get_storage().get_orders, lambda order: order.order_id)
+
+
+def get_courier(courier_id):
+    cache = request_cache('couriers')
+    if courier_id not in cache:
+        cache[courier_id] = get_storage().get_courier(courier_id)
+    return cache[courier_id]
+
+
+def get_order(order_id):
+    cache = request_cache('orders')
+    if order_id not in cache:
+        cache[order_id] = get_storage().get_order(order_id)
+    return cache[order_id]
+
+
+# Rows that were replaced, not just changed, are looked up again.
+def forget(name, ids):
+    cache = request_cache(name)
+    for id_ in ids:
+        cache.pop(id_, None)
@@ -1,31 +1,41 @@
 from src.business_data import COURIER_TYPES
+from src.engine import TimeWindowSet
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import ENUM, ARRAY
+from sqlalchemy.types import TypeDecorator, JSON
+from sqlalchemy.dialects.postgresql import ARRAY
 
 
 db = SQLAlchemy()
 
-courier_type_enum = ENUM(*COURIER_TYPES, name='courier_type')
+courier_type_enum = db.Enum(*COURIER_TYPES, name='courier_type')
 
 
-def time_intervals_to_minutes_array(time_intervals):
-    minutes_array = []
-    for time_interval in time_intervals:
-        start_time, end_time = (time_interval.split('-'))
-        start_minutes = int(start_time.split(':')[0]) * 60 + int(start_time.split(':')[1])
-        end_minutes = int(end_time.split(':')[0]) * 60 + int(end_time.split(':')[1])
-        minutes_array.append([start_minutes, end_minutes])
-    return minutes_array
+class IntegerArray(TypeDecorator):
+    # Native ARRAY on PostgreSQL, JSON text on SQLite. Both regions and [start, end]
+    # minute pairs round-trip through JSON unchanged.
+    impl = JSON
+    cache_ok = True
 
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(ARRAY(db.Integer))
+        return dialect.type_descriptor(JSON())
 
-def minutes_array_to_time_intervals(minutes_array):
-    time_intervals = []
-    for period in minutes_array:
-        start_time = str(period[0] // 60).zfill(2) + ':' + str(period[0] % 60).zfill(2)
-        end_time = str(period[1] // 60).zfill(2) + ':' + str(period[1] % 60).zfill(2)
-        time_intervals.append(f'{start_time}-{end_time}')
-    return time_intervals
+
+class TimeWindows(IntegerArray):
+    # Stored as [start, end] minute pairs like before, loaded as a TimeWindowSet.
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return [list(period) for period in value]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return TimeWindowSet(value)
 
 
 def datetime_to_rfc_3339(datetime):
@@ -37,8 +47,8 @@ class Courier(db.Model):
 
     courier_id = db.Column(db.Integer, primary_key=True)
     courier_type = db.Column(courier_type_enum)
-    regions = db.Column(ARRAY(db.Integer))
-    working_hours = db.Column(ARRAY(db.Integer))
+    regions = db.Column(IntegerArray())
+    working_hours = db.Column(TimeWindows())
     assigned_orders = db.relationship('Order', backref='courier', lazy='dynamic')
 
     def __init__(self, courier_id, courier_type, regions, working_hours):
@@ -55,7 +65,7 @@ class Courier(db.Model):
             'courier_id': self.courier_id,
             'courier_type': self.courier_type,
             'regions': self.regions,
-            'working_hours': minutes_array_to_time_intervals(self.working_hours)
+            'working_hours': list(self.working_hours.time_intervals)
         }
 
 
@@ -65,7 +75,7 @@ class Order(db.Model):
     order_id = db.Column(db.Integer, primary_key=True)
     weight = db.Column(db.Float)
     region = db.Column(db.Integer)
-    delivery_hours = db.Column(ARRAY(db.Integer))
+    delivery_hours = db.Column(TimeWindows())
 
     assigned_courier_id = db.Column(db.Integer, db.ForeignKey('couriers.courier_id'))
     assigned_courier_type = db.Column(courier_type_enum)
@@ -86,7 +96,7 @@ class Order(db.Model):
             'order_id': self.order_id,
             'weight': self.weight,
             'region': self.region,
-            'delivery_hours': minutes_array_to_time_intervals(self.delivery_hours),
+            'delivery_hours': list(self.delivery_hours.time_intervals),
             'assigned_courier_id': self.assigned_courier_id,
             'assigned_courier_type': self.assigned_courier_type,
             'assigned_time': datetime_to_rfc_3339(self.assigned_time),
@@ -98,5 +108,24 @@ class Order(db.Model):
             'order_id': self.order_id,
             'weight': self.weight,
             'region': self.region,
-            'delivery_hours': minutes_array_to_time_intervals(self.delivery_hours)
+            'delivery_hours': list(self.delivery_hours.time_intervals)
         }
+
+
+class ArchivedOrder(db.Model):
+    # Delivered orders are moved here by the archiver, so that the orders table only holds the
+    # unassigned and in-flight orders the dispatch queries work with.
+    __tablename__ = 'orders_archive'
+
+    order_id = db.Column(db.Integer, primary_key=True)
+    weight = db.Column(db.Float)
+    region = db.Column(db.Integer)
+    delivery_hours = db.Column(TimeWindows())
+
+    assigned_courier_id = db.Column(db.Integer, index=True)
+    assigned_courier_type = db.Column(courier_type_enum)
+    assigned_time = db.Column(db.String(30))
+    delivery_time = db.Column(db.Integer)
+
+    def __repr__(self):
+        return '<ArchivedOrder id {}>'.format(self.order_id)
@@ -0,0 +1,44 @@
+import threading
+
+from flask import current_app
+
+# Wakes long-polling assignment requests when orders become available in their regions. A waiter
+# is an Event registered under each of its regions, so a parked request holds no database
+# connection and costs nothing until orders arrive. Only requests served by the same process are
+# woken: with several worker processes the others still see new orders when their wait times out.
+
+
+class OrderNotifier:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}
+
+    def subscribe(self, regions):
+        event = threading.Event()
+        with self.lock:
+            for region in regions:
+                self.waiters.setdefault(region, set()).add(event)
+        return event
+
+    def unsubscribe(self, event, regions):
+        with self.lock:
+            for region in regions:
+                region_waiters = self.waiters.get(region)
+                if region_waiters is not None:
+                    region_waiters.discard(event)
+                    if not region_waiters:
+                        del self.waiters[region]
+
+    def notify(self, regions):
+        with self.lock:
+            events = [event for region in set(regions) for event in self.waiters.get(region, ())]
+        for event in events:
+            event.set()
+
+
+def init_notifier(app):
+    app.extensions['order_notifier'] = OrderNotifier()
+
+
+def get_notifier():
+    return current_app.extensions['order_notifier']
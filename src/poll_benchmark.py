@@ -0,0 +1,115 @@
+from src.app import create_app
+from src.models import db
+
+import os
+import time
+import random
+import tempfile
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+REGIONS = 20
+
+
+def current_timestamp():
+    return datetime.utcnow().isoformat('T')[:-4] + 'Z'
+
+
+def create_benchmark_app(path, couriers):
+    app = create_app({
+        'DB_BACKEND': 'sqlite',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': QueuePool,
+            'pool_size': couriers + 2,
+            'connect_args': {'timeout': 60, 'check_same_thread': False}
+        },
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.assign_requests = 0
+        self.created_at = {}
+        self.pickup_delays = []
+
+
+def run_courier(app, courier_id, stop_at, poll_interval, wait, stats):
+    client = app.test_client()
+    while time.monotonic() < stop_at:
+        url = '/orders/assign'
+        if wait:
+            url += f'?wait={max(0.0, min(wait, stop_at - time.monotonic())):.3f}'
+        order_ids = [order['id'] for order in client.post(url, json={'courier_id': courier_id}).get_json()['orders']]
+
+        picked_up_at = time.monotonic()
+        with stats.lock:
+            stats.assign_requests += 1
+            stats.pickup_delays += [picked_up_at - stats.created_at.pop(order_id)
+                                    for order_id in order_ids if order_id in stats.created_at]
+
+        for order_id in order_ids:
+            client.post('/orders/complete', json={
+                'courier_id': courier_id, 'order_id': order_id, 'complete_time': current_timestamp()
+            })
+        if not order_ids and not wait:
+            time.sleep(poll_interval)
+
+
+def run_dispatch(path, couriers, duration, order_interval, poll_interval, wait):
+    app = create_benchmark_app(path, couriers)
+    app.test_client().post('/couriers', json={'data': [{
+        'courier_id': courier_id,
+        'courier_type': 'car',
+        'regions': [courier_id % REGIONS + 1],
+        'working_hours': ['00:00-23:59']
+    } for courier_id in range(1, couriers + 1)]}).get_data()
+
+    stats = Stats()
+    with app.app_context():
+        @event.listens_for(db.get_engine(), 'before_cursor_execute')
+        def count_query(*args):
+            with stats.lock:
+                stats.queries += 1
+
+    stop_at = time.monotonic() + duration
+    threads = [threading.Thread(target=run_courier, args=(app, courier_id, stop_at, poll_interval, wait, stats))
+               for courier_id in range(1, couriers + 1)]
+    for thread in threads:
+        thread.start()
+
+    client = app.test_client()
+    rng = random.Random(0)
+    order_id = 0
+    while time.monotonic() < stop_at:
+        order_id += 1
+        with stats.lock:
+            stats.created_at[order_id] = time.monotonic()
+        client.post('/orders', json={'data': [{
+            'order_id': order_id, 'weight': 1, 'region': rng.randint(1, REGIONS), 'delivery_hours': ['00:00-23:59']
+        }]}).get_data()
+        time.sleep(order_interval)
+
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def benchmark_long_poll(couriers=100, duration=20, order_interval=0.1, poll_interval=2, wait=30, log=print):
+    log(f'{"mode":<16}{"assign req/s":>14}{"queries/s":>12}{"pickup ms":>12}')
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, mode_wait in [(f'poll {poll_interval}s', 0), (f'long poll {wait}s', wait)]:
+            path = os.path.join(directory, f'wait-{mode_wait}.db')
+            stats = run_dispatch(path, couriers, duration, order_interval, poll_interval, mode_wait)
+            pickup = sum(stats.pickup_delays) / len(stats.pickup_delays) if stats.pickup_delays else 0
+            log(f'{mode:<16}{stats.assign_requests / duration:>14.1f}{stats.queries / duration:>12.1f}'
+                f'{pickup * 1000:>12.1f}')
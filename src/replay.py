@@ -0,0 +1,184 @@
+from src.capture import read_capture_log
+
+import json
+import time
+import threading
+from datetime import datetime
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import dateutil.parser
+
+# Fields whose values depend on the moment a request is served rather than on its input.
+VOLATILE_RESPONSE_FIELDS = ['assigned_time']
+
+
+class HttpTarget:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def send(self, method, path, body):
+        response = self.session.request(method, self.url + path, json=body)
+        try:
+            response_body = response.json()
+        except ValueError:
+            response_body = None
+        return response.status_code, response_body
+
+
+class InProcessTarget:
+    def __init__(self, app, serialize=True):
+        self.app = app
+        self.lock = threading.Lock() if serialize else None
+
+    def send(self, method, path, body):
+        if self.lock is None:
+            return self._send(method, path, body)
+        with self.lock:
+            return self._send(method, path, body)
+
+    def _send(self, method, path, body):
+        try:
+            response = self.app.test_client().open(path, method=method, json=body)
+        except Exception:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, None
+        return response.status_code, response.get_json(force=True, silent=True)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def strip_volatile_fields(body):
+    if isinstance(body, dict):
+        return {key: value for key, value in body.items() if key not in VOLATILE_RESPONSE_FIELDS}
+    return body
+
+
+def format_timestamp(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-4] + 'Z'
+
+
+# Assignment times of the orders, in the captured log and in the replay. Completion times only
+# make sense relative to the assignment time, which is taken anew when the assignment is replayed,
+# so a completion is replayed as long after the replayed assignment as it originally came.
+class AssignmentTimes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captured = {}
+        self.replayed = {}
+
+    def record(self, captured_response, response):
+        with self.lock:
+            for times, body in ((self.captured, captured_response), (self.replayed, response)):
+                if isinstance(body, dict) and 'assigned_time' in body:
+                    for order in body.get('orders', []):
+                        times[order['id']] = body['assigned_time']
+
+    def shift_complete_time(self, body):
+        if not isinstance(body, dict) or 'complete_time' not in body:
+            return body
+
+        with self.lock:
+            captured_time = self.captured.get(body.get('order_id'))
+            replayed_time = self.replayed.get(body.get('order_id'))
+        # Orders assigned before the log starts, or not assigned in the replay, are left as they are.
+        if captured_time is None or replayed_time is None:
+            return body
+
+        try:
+            complete_time = dateutil.parser.isoparse(body['complete_time']).timestamp() - \
+                            dateutil.parser.isoparse(captured_time).timestamp() + \
+                            dateutil.parser.isoparse(replayed_time).timestamp()
+        except (TypeError, ValueError):
+            return body
+
+        shifted_body = dict(body)
+        shifted_body['complete_time'] = format_timestamp(complete_time)
+        return shifted_body
+
+
+class ReplayResult:
+    def __init__(self, record, status, response, latency):
+        self.record = record
+        self.status = status
+        self.response = response
+        self.latency = latency
+
+    @property
+    def endpoint(self):
+        return self.record['method'] + ' ' + self.record['path'].split('?')[0]
+
+    @property
+    def mismatched(self):
+        # Streamed responses are captured without a body, only their status can be compared.
+        if self.record['response'] is None:
+            return self.status != self.record['status']
+        return self.status != self.record['status'] or \
+               strip_volatile_fields(self.response) != strip_volatile_fields(self.record['response'])
+
+
+def replay(records, target, speed=1.0, concurrency=1):
+    if not records:
+        return [], 0
+
+    # Records are logged when their responses are sent, a long-polling request after the ones
+    # that woke it, but carry the time the request started.
+    records = sorted(records, key=lambda record: record['time'])
+    log_start = records[0]['time']
+    replay_start = time.time()
+    assignment_times = AssignmentTimes()
+
+    def send(record):
+        body = assignment_times.shift_complete_time(record['body'])
+        start = time.perf_counter()
+        status, response = target.send(record['method'], record['path'], body)
+        if record['path'].split('?')[0] == '/orders/assign':
+            assignment_times.record(record['response'], response)
+        return ReplayResult(record, status, response, time.perf_counter() - start)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            if speed:
+                delay = replay_start + (record['time'] - log_start) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(send, record))
+
+    return [future.result() for future in futures], time.time() - replay_start
+
+
+def format_report(results, elapsed):
+    endpoints = {}
+    for result in results:
+        endpoints.setdefault(result.endpoint, []).append(result.latency)
+    endpoints['total'] = [result.latency for result in results]
+
+    lines = [f'Replayed {len(results)} requests in {elapsed:.2f}s '
+             f'({len(results) / elapsed if elapsed else 0:.1f} req/s)', '']
+    lines.append(f'{"endpoint":<28}{"count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for endpoint, latencies in endpoints.items():
+        latencies = sorted(latencies)
+        lines.append(f'{endpoint:<28}{len(latencies):>8}' + ''.join(
+            f'{percentile(latencies, fraction) * 1000:>10.2f}' for fraction in (0.5, 0.9, 0.99, 1)
+        ))
+
+    mismatches = [result for result in results if result.mismatched]
+    lines.append('')
+    lines.append(f'Mismatched responses: {len(mismatches)}')
+    for result in mismatches:
+        lines.append(f'  {result.endpoint}: expected {result.record["status"]} '
+                     f'{json.dumps(result.record["response"])}, got {result.status} {json.dumps(result.response)}')
+
+    return '\n'.join(lines)
+
+
+def replay_capture_log(path, target, speed=1.0, concurrency=1):
+    results, elapsed = replay(read_capture_log(path), target, speed=speed, concurrency=concurrency)
+    return format_report(results, elapsed)
@@ -0,0 +1,49 @@
+from src.business_data import BASE_ORDER_PAYMENT
+from src.engine import rating_for_average_times
+
+import io
+import csv
+import json
+import itertools
+
+COURIER_REPORT_FIELDS = ['courier_id', 'courier_type', 'rating', 'earnings']
+
+
+def courier_report(storage):
+    # Only the rows of one courier are held at a time, whatever the number of orders.
+    for courier_id, rows in itertools.groupby(storage.iter_courier_stats(), key=lambda row: row.courier_id):
+        rows = list(rows)
+        delivered = [row for row in rows if row.region is not None]
+        yield {
+            'courier_id': courier_id,
+            'courier_type': rows[0].courier_type,
+            'rating': rating_for_average_times([row.total_time // row.deliveries for row in delivered])
+            if delivered else None,
+            'earnings': BASE_ORDER_PAYMENT * sum(row.earnings_coefficient for row in delivered)
+        }
+
+
+def format_csv(report):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(COURIER_REPORT_FIELDS)
+    for row in report:
+        yield line([row[field] for field in COURIER_REPORT_FIELDS])
+
+
+def format_ndjson(report):
+    for row in report:
+        yield json.dumps(row) + '\n'
+
+
+REPORT_FORMATS = {
+    'csv': (format_csv, 'text/csv'),
+    'ndjson': (format_ndjson, 'application/x-ndjson')
+}
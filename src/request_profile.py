@@ -0,0 +1,135 @@
+import io
+import os
+import re
+import json
+import time
+import pstats
+import random
+import cProfile
+from http import HTTPStatus
+
+from flask import request, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile-Request'
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start_time = time.time()
+        self.queries = 0
+        self.profiler = cProfile.Profile()
+        self.status = None
+        self.closed_with_response = False
+
+
+def count_query(*args):
+    # Statements run by shard fan-out threads have no app context and are not counted, nor are
+    # those of the group commit thread, which has no request context.
+    if has_app_context() and 'request_profile' in g:
+        g.request_profile.queries += 1
+
+
+def save_profile(directory, profile, endpoint, path, status):
+    duration = time.time() - profile.start_time
+    file_path = os.path.join(directory, '{}-{:06}-{}'.format(
+        time.strftime('%Y%m%d-%H%M%S', time.gmtime(profile.start_time)),
+        int(profile.start_time % 1 * 1e6),
+        re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_')
+    ))
+
+    profile.profiler.dump_stats(file_path + '.prof')
+    with open(file_path + '.json', 'w') as file:
+        json.dump({
+            'time': profile.start_time,
+            'endpoint': endpoint,
+            'path': path,
+            'status': status,
+            'duration': duration,
+            'queries': profile.queries
+        }, file)
+
+
+def init_request_profiling(app):
+    directory = app.config.get('PROFILE_DIR')
+    if not directory:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE') or 0)
+    if not event.contains(Engine, 'before_cursor_execute', count_query):
+        event.listen(Engine, 'before_cursor_execute', count_query)
+
+    @app.before_request
+    def start_profile():
+        if request.headers.get(PROFILE_HEADER) or random.random() < sample_rate:
+            g.request_profile = RequestProfile()
+            g.request_profile.profiler.enable()
+
+    def stop_profile(profile, endpoint, path, status):
+        profile.profiler.disable()
+        save_profile(directory, profile, endpoint, path, status)
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.get('request_profile')
+        if profile is None:
+            return response
+
+        profile.status = response.status_code
+        # The body of a streamed response is produced after this point, so its profile ends when
+        # the server closes the response.
+        if response.is_streamed:
+            profile.closed_with_response = True
+            endpoint, path = request_description()
+            response.call_on_close(lambda: stop_profile(profile, endpoint, path, profile.status))
+        return response
+
+    # Also runs when a request fails with an exception that after_request handlers are skipped for,
+    # as they are in testing, where exceptions propagate.
+    @app.teardown_request
+    def teardown_profile(error):
+        profile = g.get('request_profile')
+        if profile is None or profile.closed_with_response:
+            return
+        stop_profile(profile, *request_description(),
+                     profile.status if profile.status is not None else HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+def request_description():
+    endpoint = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+    return endpoint, request.full_path.rstrip('?')
+
+
+def read_profiles(directory, endpoint=None):
+    profiles = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, file_name)) as file:
+            profile = json.load(file)
+        profile['stats_path'] = os.path.join(directory, file_name[:-len('.json')] + '.prof')
+        if endpoint is None or profile['endpoint'] == endpoint:
+            profiles.append(profile)
+    return profiles
+
+
+def format_profile_list(profiles):
+    lines = [f'{"time":<20}{"endpoint":<28}{"status":>7}{"ms":>10}{"queries":>9}  file']
+    for profile in profiles:
+        lines.append(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(profile["time"])):<20}'
+                     f'{profile["endpoint"]:<28}{profile["status"]:>7}{profile["duration"] * 1000:>10.1f}'
+                     f'{profile["queries"]:>9}  {os.path.basename(profile["stats_path"])}')
+    return '\n'.join(lines)
+
+
+def aggregate_profiles(profiles, sort='cumulative', top=30):
+    stream = io.StringIO()
+    stats = pstats.Stats(*[profile['stats_path'] for profile in profiles], stream=stream)
+    durations = [profile['duration'] for profile in profiles]
+    queries = [profile['queries'] for profile in profiles]
+    stream.write(f'{len(profiles)} requests, {sum(durations) / len(durations) * 1000:.1f} ms and '
+                 f'{sum(queries) / len(queries):.1f} queries per request on average\n')
+    stats.sort_stats(sort).print_stats(top)
+    return stream.getvalue()
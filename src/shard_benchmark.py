@@ -0,0 +1,81 @@
+from src.app import create_app
+from src.models import db
+
+import os
+import time
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import QueuePool
+
+REGIONS = 100
+CHUNK_SIZE = 50
+
+
+def make_orders(count):
+    return [{
+        'order_id': order_id,
+        'weight': random.randint(1, 10),
+        'region': random.randint(1, REGIONS),
+        'delivery_hours': ['09:00-18:00']
+    } for order_id in range(1, count + 1)]
+
+
+def make_couriers(count):
+    return [{
+        'courier_id': courier_id,
+        'courier_type': 'car',
+        'regions': random.sample(range(1, REGIONS + 1), 3),
+        'working_hours': ['09:00-18:00']
+    } for courier_id in range(1, count + 1)]
+
+
+def create_sharded_app(directory, shards, clients):
+    paths = [os.path.join(directory, f'{shards}-shards-{shard}.db') for shard in range(shards)]
+    app = create_app({
+        'DB_BACKEND': 'sqlite',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + paths[0],
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': QueuePool,
+            'pool_size': clients,
+            'connect_args': {'timeout': 60, 'check_same_thread': False}
+        },
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SHARD_DATABASE_URIS': ['sqlite:///' + path for path in paths[1:]],
+        'SHARD_CONCURRENT_REQUESTS': clients,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def measure(clients, requests, send):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(send, requests))
+    return time.perf_counter() - start
+
+
+def benchmark_shards(max_shards=4, orders=5000, couriers=200, clients=8, log=print):
+    random.seed(0)
+    order_data = make_orders(orders)
+    courier_data = make_couriers(couriers)
+    order_chunks = [order_data[i:i + CHUNK_SIZE] for i in range(0, len(order_data), CHUNK_SIZE)]
+
+    log(f'{"shards":>6}{"orders/s":>12}{"assigns/s":>12}')
+    with tempfile.TemporaryDirectory() as directory:
+        for shards in range(1, max_shards + 1):
+            app = create_sharded_app(directory, shards, clients)
+            app.test_client().post('/couriers', json={'data': courier_data}).get_data()
+
+            elapsed = measure(clients, order_chunks,
+                              lambda chunk: app.test_client().post('/orders', json={'data': chunk}).get_data())
+            orders_per_second = orders / elapsed
+
+            elapsed = measure(clients, courier_data, lambda courier: app.test_client().post(
+                '/orders/assign', json={'courier_id': courier['courier_id']}
+            ))
+            assigns_per_second = couriers / elapsed
+
+            log(f'{shards:>6}{orders_per_second:>12.1f}{assigns_per_second:>12.1f}')
@@ -0,0 +1,270 @@
+from src.models import db, Courier, Order, ArchivedOrder
+from src.storage import Storage, enable_foreign_keys
+
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import _app_ctx_stack
+from sqlalchemy import create_engine, event, select, insert, update, delete
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# Orders live on the shard of their region. Couriers are few and may cover regions on several
+# shards, so every shard keeps a copy of the couriers table; the first shard is the main
+# database and holds the copy that is read.
+
+
+class ShardRouter:
+    def __init__(self, engines, region_map=None):
+        self.engines = engines
+        self.region_map = dict(region_map or {})
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for_region(self, region):
+        if region in self.region_map:
+            return self.region_map[region]
+        return region % len(self.engines)
+
+    def group_regions(self, regions):
+        shard_regions = {}
+        for region in regions:
+            shard_regions.setdefault(self.shard_for_region(region), []).append(region)
+        return shard_regions
+
+
+def copy_courier(courier):
+    return Courier(
+        courier_id=courier.courier_id,
+        courier_type=courier.courier_type,
+        regions=list(courier.regions),
+        working_hours=courier.working_hours
+    )
+
+
+class ShardedStorage:
+    def __init__(self, router, sessions, concurrent_requests=32):
+        self.router = router
+        self.sessions = sessions
+        # Shared by all requests: every concurrent request may read all shards but the main one.
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(sessions) - 1) * concurrent_requests)
+
+    def shards(self):
+        # Scoped sessions are resolved in the calling thread: the fan-out threads must work
+        # with the sessions of the request that started them.
+        return [Storage(session()) for session in self.sessions]
+
+    def fan_out(self, call, shard_ids=None):
+        shards = self.shards()
+        if shard_ids is None:
+            shard_ids = range(len(shards))
+
+        # The main database is always queried from the calling thread, as its engine is set up by
+        # Flask-SQLAlchemy and SQLite connections may not be shared between threads there.
+        futures = {shard_id: self.executor.submit(call, shard_id, shards[shard_id])
+                   for shard_id in shard_ids if shard_id != 0}
+        results = {shard_id: call(shard_id, shards[shard_id]) for shard_id in shard_ids if shard_id == 0}
+        return [results[shard_id] if shard_id == 0 else futures[shard_id].result() for shard_id in shard_ids]
+
+    def fan_in(self, call, shard_ids=None):
+        return [order for orders in self.fan_out(call, shard_ids) for order in orders]
+
+    def write_shards(self, call, shard_ids=None):
+        # Writes run in the calling thread, one shard after another in shard order like the commits.
+        # Concurrent requests then take the write locks of the shards in the same order, and none of
+        # them can hold a shard that another one holding the next shard waits for.
+        shards = self.shards()
+        return [call(shard_id, shards[shard_id])
+                for shard_id in sorted(range(len(shards)) if shard_ids is None else shard_ids)]
+
+    def group_orders(self, orders):
+        shard_orders = {}
+        for order_id, region in orders.items():
+            shard_orders.setdefault(self.router.shard_for_region(region), {})[order_id] = region
+        return shard_orders
+
+    def get_courier(self, courier_id):
+        return self.shards()[0].get_courier(courier_id)
+
+    def get_couriers(self, courier_ids):
+        return self.shards()[0].get_couriers(courier_ids)
+
+    def add_courier(self, courier, replace=True):
+        self.write_shards(lambda shard_id, shard: shard.add_courier(
+            courier if shard_id == 0 else copy_courier(courier), replace=replace
+        ))
+
+    def update_courier(self, courier_id, values):
+        self.write_shards(lambda shard_id, shard: shard.update_courier(courier_id, values))
+
+    def get_order(self, order_id):
+        orders = self.fan_out(lambda shard_id, shard: shard.get_order(order_id))
+        return next((order for order in orders if order is not None), None)
+
+    def get_orders(self, order_ids):
+        return self.fan_in(lambda shard_id, shard: shard.get_orders(order_ids))
+
+    def find_order(self, order_id):
+        found = self.fan_out(lambda shard_id, shard: shard.get_order(order_id) is not None)
+        return [shard_id for shard_id, has_order in enumerate(found) if has_order]
+
+    def add_order(self, order, replace=True):
+        target = self.router.shard_for_region(order.region)
+        found = self.find_order(order.order_id) if replace else []
+
+        def add(shard_id, shard):
+            if shard_id in found:
+                shard.delete_order(order.order_id)
+            if shard_id == target:
+                shard.session.add(order)
+                # The insert would otherwise lock the target at commit, after the shards above it.
+                if any(found_id > target for found_id in found):
+                    shard.session.flush()
+
+        self.write_shards(add, set(found) | {target})
+
+    def delete_order(self, order_id):
+        # Looking the order up first keeps shards that don't have it from taking a write lock.
+        self.write_shards(lambda shard_id, shard: shard.delete_order(order_id), self.find_order(order_id))
+
+    def update_orders(self, orders, values):
+        shard_orders = self.group_orders(orders)
+        self.write_shards(lambda shard_id, shard: shard.update_orders(shard_orders[shard_id], values), shard_orders)
+
+    def assign_orders(self, orders, values):
+        shard_orders = self.group_orders(orders)
+        self.write_shards(lambda shard_id, shard: shard.assign_orders(shard_orders[shard_id], values), shard_orders)
+
+    def get_assigned_orders(self, courier_id):
+        return self.fan_in(lambda shard_id, shard: shard.get_assigned_orders(courier_id))
+
+    def get_remaining_orders(self, courier_id):
+        return self.fan_in(lambda shard_id, shard: shard.get_remaining_orders(courier_id))
+
+    def get_delivered_orders(self, courier_id):
+        return self.fan_in(lambda shard_id, shard: shard.get_delivered_orders(courier_id))
+
+    def get_unassigned_orders(self, max_weight, regions):
+        shard_regions = self.router.group_regions(regions)
+        return self.fan_in(lambda shard_id, shard: shard.get_unassigned_orders(max_weight, shard_regions[shard_id]),
+                           shard_ids=shard_regions)
+
+    def iter_courier_stats(self):
+        # Every shard has all couriers, so merging the sorted shard streams keeps each courier's
+        # rows together. Shards without its deliveries add a row without a region.
+        return heapq.merge(*[shard.iter_courier_stats() for shard in self.shards()], key=lambda row: row.courier_id)
+
+    def archive_delivered_orders(self, batch_size):
+        return sum(self.write_shards(lambda shard_id, shard: shard.archive_delivered_orders(batch_size)))
+
+    def commit(self):
+        # Shards are committed one after another, not atomically.
+        for shard in self.shards():
+            shard.commit()
+
+    def rollback(self):
+        for shard in self.shards():
+            shard.rollback()
+
+    def refresh(self):
+        for shard in self.shards():
+            shard.refresh()
+
+    def release(self):
+        for shard in self.shards():
+            shard.release()
+
+
+def create_shard_engine(uri):
+    if uri.startswith('sqlite'):
+        # A request's shard session is used by a fan-out thread and then committed by the request
+        # thread, one after the other.
+        engine = create_engine(uri, connect_args={'check_same_thread': False}, poolclass=QueuePool)
+        event.listen(engine, 'connect', enable_foreign_keys)
+    else:
+        engine = create_engine(uri)
+
+    # Migrations only run against the main database, the other shards get their schema here.
+    db.metadata.create_all(engine)
+    return engine
+
+
+def init_sharding(app):
+    shard_uris = app.config.get('SHARD_DATABASE_URIS')
+    if not shard_uris:
+        return
+
+    with app.app_context():
+        engines = [db.get_engine()] + [create_shard_engine(uri) for uri in shard_uris]
+
+    sessions = [db.session] + [scoped_session(sessionmaker(bind=engine), scopefunc=_app_ctx_stack.__ident_func__)
+                               for engine in engines[1:]]
+
+    @app.teardown_appcontext
+    def remove_shard_sessions(exception):
+        for session in sessions[1:]:
+            session.remove()
+
+    router = ShardRouter(engines, region_map=app.config.get('SHARD_REGION_MAP'))
+    app.extensions['storage'] = ShardedStorage(router, sessions,
+                                               concurrent_requests=int(app.config.get('SHARD_CONCURRENT_REQUESTS', 32)))
+
+
+def sync_couriers(router):
+    couriers = Courier.__table__
+    with router.engines[0].connect() as connection:
+        rows = [dict(row) for row in connection.execute(select(couriers)).mappings()]
+
+    for engine in router.engines[1:]:
+        with engine.begin() as connection:
+            existing_ids = set(connection.execute(select(couriers.c.courier_id)).scalars())
+            new_rows = [row for row in rows if row['courier_id'] not in existing_ids]
+            if new_rows:
+                connection.execute(insert(couriers), new_rows)
+            for row in rows:
+                if row['courier_id'] in existing_ids:
+                    connection.execute(update(couriers).where(couriers.c.courier_id == row['courier_id'])
+                                       .values(row))
+
+
+def move_rows(router, table, source, batch_size):
+    moved = 0
+    with router.engines[source].connect() as connection:
+        regions = list(connection.execute(select(table.c.region).distinct()).scalars())
+
+    for region in regions:
+        target = router.shard_for_region(region)
+        if target == source:
+            continue
+
+        while True:
+            with router.engines[source].connect() as connection:
+                rows = [dict(row) for row in connection.execute(
+                    select(table).where(table.c.region == region).limit(batch_size)
+                ).mappings()]
+            if not rows:
+                break
+
+            ids = [row['order_id'] for row in rows]
+            # Rows are written to the target before they are removed from the source, and
+            # any copy left there by an interrupted run is replaced.
+            with router.engines[target].begin() as connection:
+                connection.execute(delete(table).where(table.c.order_id.in_(ids)))
+                connection.execute(insert(table), rows)
+            with router.engines[source].begin() as connection:
+                connection.execute(delete(table).where(table.c.order_id.in_(ids)))
+
+            moved += len(rows)
+
+    return moved
+
+
+def rebalance(router, batch_size=1000):
+    sync_couriers(router)
+
+    moved = 0
+    for source in range(len(router)):
+        for table in (Order.__table__, ArchivedOrder.__table__):
+            moved += move_rows(router, table, source, batch_size)
+    return moved
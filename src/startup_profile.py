@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import subprocess
+
+from src.app import ROOT_PATH
+
+# Runs in a fresh interpreter so that nothing is imported before the measurement starts.
+PROFILED_STARTUP = '''
+import json
+import time
+
+start = time.perf_counter()
+from src.app import create_app
+app = create_app()
+created = time.perf_counter()
+
+response = app.test_client().post('/couriers', json={'data': []})
+response.get_data()
+first_request = time.perf_counter()
+
+print(json.dumps({
+    'create_app': created - start,
+    'first_request': first_request - created,
+    'status': response.status_code
+}))
+'''
+
+
+def parse_import_times(stderr):
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative_time, module = line[len('import time:'):].split('|')
+        import_times.append((module.strip(), int(self_time) / 1e6, int(cumulative_time) / 1e6))
+    return import_times
+
+
+def profile_startup():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILED_STARTUP],
+        cwd=ROOT_PATH, env=os.environ.copy(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError('Profiled startup failed:\n' + result.stderr[-2000:])
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_import_times(result.stderr)
+    return timings
+
+
+def format_startup_report(timings, top=20):
+    total = timings['create_app'] + timings['first_request']
+    lines = [
+        f'create_app():        {timings["create_app"] * 1000:8.1f} ms',
+        f'first request:       {timings["first_request"] * 1000:8.1f} ms (status {timings["status"]})',
+        f'time to first request: {total * 1000:6.1f} ms',
+        '',
+        f'Slowest imports by cumulative time (top {top}):',
+        f'{"module":<50}{"self ms":>10}{"cumul. ms":>12}'
+    ]
+    slowest = sorted(timings['imports'], key=lambda import_time: import_time[2], reverse=True)[:top]
+    for module, self_time, cumulative_time in slowest:
+        lines.append(f'{module:<50}{self_time * 1000:>10.1f}{cumulative_time * 1000:>12.1f}')
+
+    return '\n'.join(lines)
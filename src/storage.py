@@ -0,0 +1,193 @@
+from src.models import db, Courier, Order, ArchivedOrder
+from src.business_data import EARNINGS_COEFFICIENTS
+
+from flask import current_app
+from sqlalchemy import and_, case, event, exists, func, insert, select, union_all
+from sqlalchemy.orm import aliased
+
+
+class Storage:
+    def __init__(self, session):
+        self.session = session
+
+    def get_courier(self, courier_id):
+        return self.session.get(Courier, courier_id)
+
+    def get_couriers(self, courier_ids):
+        return self.session.query(Courier).filter(Courier.courier_id.in_(courier_ids)).all()
+
+    def add_courier(self, courier, replace=True):
+        old_courier = self.get_courier(courier.courier_id) if replace else None
+        if old_courier is not None:
+            self.session.delete(old_courier)
+            self.session.query(ArchivedOrder).filter_by(assigned_courier_id=courier.courier_id)\
+                .update({'assigned_courier_id': None})
+
+        self.session.add(courier)
+
+    def update_courier(self, courier_id, values):
+        self.session.query(Courier).filter_by(courier_id=courier_id).update(values)
+
+    def get_order(self, order_id):
+        order = self.session.get(Order, order_id)
+        if order is None:
+            order = self.session.get(ArchivedOrder, order_id)
+        return order
+
+    def get_orders(self, order_ids):
+        orders = self.session.query(Order).filter(Order.order_id.in_(order_ids)).all()
+        archived_ids = set(order_ids) - {order.order_id for order in orders}
+        if archived_ids:
+            orders += self.session.query(ArchivedOrder).filter(ArchivedOrder.order_id.in_(archived_ids)).all()
+        return orders
+
+    def add_order(self, order, replace=True):
+        if replace:
+            self.delete_order(order.order_id)
+        self.session.add(order)
+
+    def delete_order(self, order_id):
+        self.session.query(Order).filter_by(order_id=order_id).delete()
+        self.session.query(ArchivedOrder).filter_by(order_id=order_id).delete()
+
+    # Orders to write are given as a mapping of their ids to their regions, which sharded storage
+    # routes them by.
+    def update_orders(self, orders, values):
+        self.session.query(Order).filter(Order.order_id.in_(list(orders))).update(values, synchronize_session=False)
+
+    def assign_orders(self, orders, values):
+        # Orders taken by another courier in the meantime are left to them.
+        self.session.query(Order).filter(and_(
+            Order.order_id.in_(list(orders)),
+            Order.assigned_time.is_(None)
+        )).update(values, synchronize_session=False)
+
+    def get_assigned_orders(self, courier_id):
+        return self.session.query(Order).filter_by(assigned_courier_id=courier_id).all()
+
+    def get_remaining_orders(self, courier_id):
+        return self.session.query(Order).filter(and_(
+            Order.assigned_courier_id == courier_id,
+            Order.delivery_time.is_(None)
+        )).all()
+
+    def get_delivered_orders(self, courier_id):
+        return self.session.query(Order).filter(and_(
+            Order.assigned_courier_id == courier_id,
+            Order.delivery_time.isnot(None)
+        )).all() + self.session.query(ArchivedOrder).filter_by(assigned_courier_id=courier_id).all()
+
+    def get_unassigned_orders(self, max_weight, regions):
+        return self.session.query(Order).filter(and_(
+            Order.assigned_time.is_(None),
+            Order.weight <= max_weight,
+            Order.region.in_(regions)
+        )).all()
+
+    def iter_courier_stats(self):
+        # One row per courier and region of its deliveries, or a single row without a region for
+        # couriers that delivered nothing, ordered by courier. Rows are streamed from the database.
+        delivered = union_all(
+            select(Order.assigned_courier_id.label('courier_id'), Order.region, Order.delivery_time,
+                   Order.assigned_courier_type).where(Order.delivery_time.isnot(None)),
+            select(ArchivedOrder.assigned_courier_id, ArchivedOrder.region, ArchivedOrder.delivery_time,
+                   ArchivedOrder.assigned_courier_type)
+        ).subquery()
+        stats = select(
+            delivered.c.courier_id,
+            delivered.c.region,
+            func.sum(delivered.c.delivery_time).label('total_time'),
+            func.count().label('deliveries'),
+            func.sum(case(EARNINGS_COEFFICIENTS, value=delivered.c.assigned_courier_type, else_=0))
+            .label('earnings_coefficient')
+        ).group_by(delivered.c.courier_id, delivered.c.region).subquery()
+
+        return self.session.execute(
+            select(Courier.courier_id, Courier.courier_type, stats.c.region, stats.c.total_time,
+                   stats.c.deliveries, stats.c.earnings_coefficient)
+            .outerjoin(stats, stats.c.courier_id == Courier.courier_id)
+            .order_by(Courier.courier_id, stats.c.region),
+            execution_options={'stream_results': True}
+        )
+
+    def archive_delivered_orders(self, batch_size):
+        # Only batches without undelivered orders are archived: the delivery time of the next
+        # order in a batch is counted from the previous deliveries in it.
+        undelivered = aliased(Order)
+        order_ids = [order_id for order_id, in self.session.query(Order.order_id).filter(and_(
+            Order.delivery_time.isnot(None),
+            ~exists().where(and_(
+                undelivered.assigned_courier_id == Order.assigned_courier_id,
+                undelivered.assigned_time == Order.assigned_time,
+                undelivered.delivery_time.is_(None)
+            ))
+        )).order_by(Order.order_id).limit(batch_size)]
+
+        if order_ids:
+            columns = [column.name for column in ArchivedOrder.__table__.columns]
+            self.session.execute(insert(ArchivedOrder.__table__).from_select(
+                columns,
+                db.select([Order.__table__.c[column] for column in columns])
+                .where(Order.order_id.in_(order_ids))
+            ))
+            self.session.query(Order).filter(Order.order_id.in_(order_ids)).delete(synchronize_session=False)
+
+        return len(order_ids)
+
+    def commit(self):
+        self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
+
+    def refresh(self):
+        self.session.expire_all()
+
+    def release(self):
+        # Returns the connection to the pool. Loaded objects are detached but stay readable.
+        self.session.close()
+
+
+class PostgresStorage(Storage):
+    @classmethod
+    def setup(cls, app):
+        pass
+
+
+class SqliteStorage(Storage):
+    @classmethod
+    def setup(cls, app):
+        with app.app_context():
+            engine = db.get_engine()
+            event.listen(engine, 'connect', enable_foreign_keys)
+
+            # An in-memory database lives only as long as its connection, so there is
+            # nothing for migrations to upgrade: the schema is created on startup instead.
+            if engine.url.database in (None, '', ':memory:'):
+                db.create_all()
+
+
+def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+STORAGE_BACKENDS = {
+    'postgresql': PostgresStorage,
+    'sqlite': SqliteStorage
+}
+
+
+def init_storage(app):
+    backend = app.config.get('DB_BACKEND', 'postgresql')
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f'Unknown storage backend: {backend}')
+
+    storage_class = STORAGE_BACKENDS[backend]
+    storage_class.setup(app)
+    app.extensions['storage'] = storage_class(db.session)
+
+
+def get_storage():
+    return current_app.extensions['storage']
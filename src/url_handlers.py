@@ -1,143 +1,158 @@
 from src.json_schemas import post_schema, courier_post_schema, courier_patch_schema,\
-    order_post_schema, order_complete_schema
-from src.models import db, Courier, Order, time_intervals_to_minutes_array
-from src.business_data import MAX_LOAD_CAPACITY, calculate_rating, calculate_earnings
+    order_post_schema, order_complete_schema, validation_error
+from src.models import Courier, Order
+from src.storage import get_storage
+from src.group_commit import InsertOrReplace, write
+from src.lookups import get_courier, get_order, get_couriers, get_orders, forget
+from src.notifier import get_notifier
+from src.reports import courier_report, REPORT_FORMATS
+from src.business_data import MAX_LOAD_CAPACITY
+from src.engine import TimeWindowSet, intersect, fits_courier, count_delivery_time as count_batch_delivery_time, \
+    calculate_rating, calculate_earnings
 
 import json
-import itertools
+import time
 from http import HTTPStatus
 
-from flask import request, abort, make_response
+from flask import request, abort, make_response, Response, stream_with_context
 from flask_restful import Resource
-from sqlalchemy import and_
 from datetime import datetime
-import dateutil.parser
-from dateutil.relativedelta import relativedelta
-import jsonschema
+
+MAX_ASSIGN_WAIT = 60
+IMPORT_CHUNK_SIZE = 500
 
 
 def abort_json(message, status_code):
     abort(make_response(json.dumps({'details': message}), status_code))
 
 
-def add_courier(courier):
-    already_exists = True if Courier.query.filter_by(courier_id=courier['courier_id']).first() else False
+def insert_operations(items, id_field, existing, add):
+    # An id repeated in the payload replaces the entry added before it, like one that is stored.
+    added_ids = set()
+    operations = []
+    for item in items:
+        operations.append(InsertOrReplace(lambda storage, replace, item=item: add(storage, item, replace),
+                                          replace=existing[item[id_field]] is not None or item[id_field] in added_ids))
+        added_ids.add(item[id_field])
+    return operations
 
-    if already_exists:
-        old_courier = Courier.query.filter_by(courier_id=courier['courier_id']).first()
-        db.session.delete(old_courier)
 
-    courier = Courier(
-        courier_id=courier['courier_id'],
-        courier_type=courier['courier_type'],
-        regions=courier['regions'],
-        working_hours=time_intervals_to_minutes_array(courier['working_hours']),
-    )
-    db.session.add(courier)
-    db.session.commit()
+def add_couriers(couriers):
+    courier_ids = [courier['courier_id'] for courier in couriers]
+    existing = get_couriers(courier_ids)
 
+    def add(storage, courier, replace):
+        storage.add_courier(Courier(
+            courier_id=courier['courier_id'],
+            courier_type=courier['courier_type'],
+            regions=courier['regions'],
+            working_hours=TimeWindowSet.parse(courier['working_hours']),
+        ), replace=replace)
 
-def get_courier(courier_id):
-    return Courier.query.filter_by(courier_id=courier_id).first()
+    write(*insert_operations(couriers, 'courier_id', existing, add))
+    forget('couriers', courier_ids)
 
 
 def patch_courier(courier_id, patch_info):
     if patch_info:
         if 'working_hours' in patch_info:
-            patch_info['working_hours'] = time_intervals_to_minutes_array(patch_info['working_hours'])
-
-        Courier.query.filter_by(courier_id=courier_id).update(patch_info)
-        db.session.commit()
-
-
-def time_ranges_intersect(range1, range2):
-    return (
-        (range1[1] < range1[0] and range2[1] < range2[0]) or
-        (range1[0] <= range2[1] and range2[0] <= range1[1]) or
-        (range1[1] < range1[0] <= range2[1]) or
-        (range2[0] <= range1[1] < range1[0]) or
-        (range1[0] <= range2[1] < range2[0]) or
-        (range2[1] < range2[0] <= range1[1])
-    )
-
-
-def intersect(minutes_list1, minutes_list2):
-    return any([time_ranges_intersect(period1, period2)
-                for period1, period2 in itertools.product(minutes_list1, minutes_list2)])
+            patch_info['working_hours'] = TimeWindowSet.parse(patch_info['working_hours'])
 
-
-def fits_assigned_courier(order):
-    return order.weight <= MAX_LOAD_CAPACITY[order.courier.courier_type] and \
-           order.region in order.courier.regions and \
-           intersect(order.delivery_hours, order.courier.working_hours)
+        write(lambda storage: storage.update_courier(courier_id, patch_info))
 
 
 def get_remaining_orders(courier_id):
-    return [order for order in get_courier(courier_id).assigned_orders if order.delivery_time is None]
-
+    return get_storage().get_remaining_orders(courier_id)
 
-def get_suitable_orders(courier):
-    return [order for order in Order.query.filter(and_(
-        Order.assigned_time.is_(None),
-        Order.weight <= MAX_LOAD_CAPACITY[courier.courier_type],
-        Order.region.in_(courier.regions)
-    )) if intersect(order.delivery_hours, courier.working_hours)]
 
+def get_suitable_orders(courier_type, regions, working_hours):
+    return [order for order in get_storage().get_unassigned_orders(
+        max_weight=MAX_LOAD_CAPACITY[courier_type],
+        regions=regions
+    ) if intersect(order.delivery_hours, working_hours)]
 
-def assign_orders(courier, orders):
-    current_time = current_timestamp()
-    for order in orders:
-        order.courier = courier
-        order.assigned_time = current_time
-        order.assigned_courier_type = courier.courier_type
 
-    db.session.commit()
+def assign_orders(courier_id, courier_type, orders):
+    order_regions = {order.order_id: order.region for order in orders}
+    values = {
+        'assigned_courier_id': courier_id,
+        'assigned_time': current_timestamp(),
+        'assigned_courier_type': courier_type
+    }
+    write(lambda storage: storage.assign_orders(order_regions, values))
 
 
 def update_assigned_orders(courier_id):
-    remaining_orders = get_remaining_orders(courier_id)
+    courier = get_courier(courier_id)
+
+    released_orders = [order for order in get_storage().get_remaining_orders(courier_id)
+                       if not fits_courier(order, courier)]
+    if released_orders:
+        order_regions = {order.order_id: order.region for order in released_orders}
+        values = {'assigned_time': None, 'assigned_courier_id': None, 'assigned_courier_type': None}
+        write(lambda storage: storage.update_orders(order_regions, values))
+        get_notifier().notify(order_regions.values())
+
+
+def assign_suitable_orders(courier, wait):
+    # The courier subscribes before every scan, so orders added while it scans still wake it up.
+    # Woken couriers race for the same orders, and those left with none go back to waiting. The
+    # courier is read once: a write expires it and releasing the session detaches it.
+    courier_id, courier_type = courier.courier_id, courier.courier_type
+    regions, working_hours = list(courier.regions), courier.working_hours
+    deadline = time.monotonic() + wait
+    notifier = get_notifier()
+
+    while True:
+        event = notifier.subscribe(regions)
+        try:
+            suitable_orders = get_suitable_orders(courier_type, regions, working_hours)
+            if suitable_orders:
+                assign_orders(courier_id, courier_type, suitable_orders)
+                remaining_orders = get_remaining_orders(courier_id)
+                if remaining_orders:
+                    return remaining_orders
 
-    for order in remaining_orders:
-        if not fits_assigned_courier(order):
-            order.assigned_time = None
-            order.courier = None
-            order.assigned_courier_type = None
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return []
 
-    db.session.commit()
+            # A parked request must not hold a database connection.
+            get_storage().release()
+            event.wait(timeout)
+        finally:
+            notifier.unsubscribe(event, regions)
 
 
-def add_order(order):
-    already_exists = True if Order.query.filter_by(order_id=order['order_id']).first() else False
+def add_orders(orders):
+    order_ids = [order['order_id'] for order in orders]
+    existing = get_orders(order_ids)
 
-    if already_exists:
-        Order.query.filter_by(order_id=order['order_id']).delete()
+    def add(storage, order, replace):
+        storage.add_order(Order(
+            order_id=order['order_id'],
+            weight=order['weight'],
+            region=order['region'],
+            delivery_hours=TimeWindowSet.parse(order['delivery_hours']),
+        ), replace=replace)
 
-    order = Order(
-        order_id=order['order_id'],
-        weight=order['weight'],
-        region=order['region'],
-        delivery_hours=time_intervals_to_minutes_array(order['delivery_hours']),
-    )
-    db.session.add(order)
-    db.session.commit()
+    write(*insert_operations(orders, 'order_id', existing, add))
+    forget('orders', order_ids)
+    get_notifier().notify([order['region'] for order in orders])
 
 
-def get_order(order_id):
-    return Order.query.filter_by(order_id=order_id).first()
+def validate_request(schema):
+    error = validation_error(request.json, schema)
+    if error is not None:
+        abort_json(error, HTTPStatus.BAD_REQUEST)
 
 
 def validate_post_request():
-    try:
-        jsonschema.validate(request.json, schema=post_schema)
-    except jsonschema.exceptions.ValidationError as e:
-        abort_json(e.message, HTTPStatus.BAD_REQUEST)
+    validate_request(post_schema)
 
 
 def validate_patch_request():
-    try:
-        jsonschema.validate(request.json, schema=courier_patch_schema)
-    except jsonschema.exceptions.ValidationError as e:
-        abort_json(e.message, HTTPStatus.BAD_REQUEST)
+    validate_request(courier_patch_schema)
 
 
 def validate_assign_request():
@@ -146,10 +161,55 @@ def validate_assign_request():
 
 
 def validate_complete_request():
+    validate_request(order_complete_schema)
+
+
+def get_assign_wait():
     try:
-        jsonschema.validate(request.json, schema=order_complete_schema)
-    except jsonschema.exceptions.ValidationError as e:
-        abort_json(e.message, HTTPStatus.BAD_REQUEST)
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = None
+
+    if wait is None or not 0 <= wait <= MAX_ASSIGN_WAIT:
+        abort_json(f'Wait must be a number of seconds from 0 to {MAX_ASSIGN_WAIT}', HTTPStatus.BAD_REQUEST)
+    return wait
+
+
+def stream_import(items, schema, collection, id_field, add_items, invalid_entry):
+    # The items are stored chunk by chunk before the response starts, so an import completes
+    # whether or not its body is read. Only the positions of invalid items are kept, and the body,
+    # the ids of an import without errors or the errors of one with them, is written from the
+    # payload as it is sent.
+    invalid_positions = []
+    for start in range(0, len(items), IMPORT_CHUNK_SIZE):
+        valid_items = []
+        for position, item in enumerate(items[start:start + IMPORT_CHUNK_SIZE], start):
+            if validation_error(item, schema) is None:
+                valid_items.append(item)
+            else:
+                invalid_positions.append(position)
+        add_items(valid_items)
+
+    def generate_ids():
+        yield '{"%s": [' % collection
+        for start in range(0, len(items), IMPORT_CHUNK_SIZE):
+            yield (', ' if start else '') + ', '.join(
+                json.dumps({'id': item[id_field]}) for item in items[start:start + IMPORT_CHUNK_SIZE]
+            )
+        yield ']}\n'
+
+    def generate_errors():
+        yield '{"validation_error": {"%s": [' % collection
+        for start in range(0, len(invalid_positions), IMPORT_CHUNK_SIZE):
+            yield (', ' if start else '') + ', '.join(
+                json.dumps(invalid_entry(items[position], validation_error(items[position], schema)))
+                for position in invalid_positions[start:start + IMPORT_CHUNK_SIZE]
+            )
+        yield ']}}'
+
+    if invalid_positions:
+        return Response(generate_errors(), status=HTTPStatus.BAD_REQUEST, mimetype='application/json')
+    return Response(generate_ids(), status=HTTPStatus.CREATED, mimetype='application/json')
 
 
 def current_timestamp():
@@ -157,18 +217,20 @@ def current_timestamp():
 
 
 def count_delivery_time(courier, completed_order, complete_time_str):
+    import dateutil.parser  # deferred until the first completion to keep startup fast
+
     complete_time = dateutil.parser.isoparse(complete_time_str)
-    completed_orders_from_the_same_batch = [order for order in courier.assigned_orders
+    completed_orders_from_the_same_batch = [order for order in get_storage().get_assigned_orders(courier.courier_id)
                                             if order.assigned_time == completed_order.assigned_time
                                             and order.delivery_time is not None]
 
-    delivery_start = dateutil.parser.isoparse(completed_order.assigned_time)
-
-    if completed_orders_from_the_same_batch:
-        delivery_start += relativedelta(seconds=max([order.delivery_time for order in
-                                                     completed_orders_from_the_same_batch]))
+    assigned_time = dateutil.parser.isoparse(completed_order.assigned_time)
 
-    return (complete_time - delivery_start).total_seconds()
+    return count_batch_delivery_time(
+        assigned_time=assigned_time.timestamp(),
+        complete_time=complete_time.timestamp(),
+        batch_delivery_times=[order.delivery_time for order in completed_orders_from_the_same_batch]
+    )
 
 
 class Couriers(Resource):
@@ -176,25 +238,11 @@ class Couriers(Resource):
     def post():
         validate_post_request()
 
-        invalid_ids = []
-        valid_ids = []
-
-        for courier in request.json['data']:
-            try:
-                jsonschema.validate(courier, schema=courier_post_schema)
-                add_courier(courier)
-                valid_ids.append({'id': courier['courier_id']})
-            except jsonschema.exceptions.ValidationError as e:
-                if 'courier_id' in courier:
-                    invalid_ids.append({'id': courier['courier_id'], 'details': e.message})
-                else:
-                    invalid_ids.append({'id': None})
-
-        if invalid_ids:
-            response_dict = {'validation_error': {'couriers': invalid_ids}}
-            abort(make_response(json.dumps(response_dict), HTTPStatus.BAD_REQUEST))
-
-        return {'couriers': valid_ids}, HTTPStatus.CREATED
+        return stream_import(
+            request.json['data'], courier_post_schema, 'couriers', 'courier_id', add_couriers,
+            lambda courier, error: {'id': courier['courier_id'], 'details': error} if 'courier_id' in courier
+            else {'id': None}
+        )
 
 
 class CouriersId(Resource):
@@ -219,10 +267,10 @@ class CouriersId(Resource):
 
         courier_info = courier.serialize()
 
-        delivered_orders = Order.query.filter(and_(Order.courier == courier, Order.delivery_time.isnot(None)))
+        delivered_orders = get_storage().get_delivered_orders(courier_id)
 
-        courier_info['rating'] = calculate_rating([order.get_full_info() for order in delivered_orders])
-        courier_info['earnings'] = calculate_earnings([order.get_full_info() for order in delivered_orders])
+        courier_info['rating'] = calculate_rating(delivered_orders)
+        courier_info['earnings'] = calculate_earnings(delivered_orders)
 
         return courier_info, HTTPStatus.OK
 
@@ -232,31 +280,17 @@ class Orders(Resource):
     def post():
         validate_post_request()
 
-        invalid_ids = []
-        valid_ids = []
-
-        for order in request.json['data']:
-            try:
-                jsonschema.validate(order, schema=order_post_schema)
-                add_order(order)
-                valid_ids.append({'id': order['order_id']})
-            except jsonschema.exceptions.ValidationError as e:
-                if 'order_id' in order:
-                    invalid_ids.append({'id': order['order_id'], 'details': e.message})
-                else:
-                    invalid_ids.append({'id': None, 'details': e.message})
-
-        if invalid_ids:
-            response_dict = {'validation_error': {'orders': invalid_ids}}
-            abort(make_response(json.dumps(response_dict), HTTPStatus.BAD_REQUEST))
-
-        return {'orders': valid_ids}, HTTPStatus.CREATED
+        return stream_import(
+            request.json['data'], order_post_schema, 'orders', 'order_id', add_orders,
+            lambda order, error: {'id': order['order_id'] if 'order_id' in order else None, 'details': error}
+        )
 
 
 class OrdersAssign(Resource):
     @staticmethod
     def post():
         validate_assign_request()
+        wait = get_assign_wait()
 
         courier = get_courier(request.json['courier_id'])
         if courier is None:
@@ -265,12 +299,7 @@ class OrdersAssign(Resource):
         remaining_orders = get_remaining_orders(courier.courier_id)
 
         if not remaining_orders:
-            suitable_orders = get_suitable_orders(courier)
-
-            if suitable_orders:
-                assign_orders(courier, suitable_orders)
-
-            remaining_orders = get_remaining_orders(courier.courier_id)
+            remaining_orders = assign_suitable_orders(courier, wait)
 
         if not remaining_orders:
             response = {'orders': []}
@@ -297,7 +326,7 @@ class OrdersComplete(Resource):
         if order is None:
             abort_json('No order with provided id found', HTTPStatus.BAD_REQUEST)
 
-        if order.courier != courier:
+        if order.assigned_courier_id != courier.courier_id:
             abort_json('This order is not assigned to given courier', HTTPStatus.BAD_REQUEST)
 
         if order.delivery_time is None:
@@ -306,7 +335,18 @@ class OrdersComplete(Resource):
             if delivery_time < 0:
                 abort_json('Negative delivery time', HTTPStatus.BAD_REQUEST)
 
-            order.delivery_time = delivery_time
-            db.session.commit()
+            order_regions = {order.order_id: order.region}
+            write(lambda storage: storage.update_orders(order_regions, {'delivery_time': delivery_time}))
+
+        return {'order_id': request.json['order_id']}, HTTPStatus.OK
+
+
+class CouriersReport(Resource):
+    @staticmethod
+    def get():
+        report_format = request.args.get('format', 'csv')
+        if report_format not in REPORT_FORMATS:
+            abort_json(f'Format must be one of: {", ".join(REPORT_FORMATS)}', HTTPStatus.BAD_REQUEST)
 
-        return {'order_id': order.order_id}, HTTPStatus.OK
+        format_report, mimetype = REPORT_FORMATS[report_format]
+        return Response(stream_with_context(format_report(courier_report(get_storage()))), mimetype=mimetype)
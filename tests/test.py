@@ -1,3 +1,9 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import json as json_module
 import requests
 import traceback
 from datetime import datetime
@@ -10,8 +16,47 @@ def current_timestamp():
     return datetime.utcnow().isoformat('T')[:-4] + 'Z'
 
 
+class HttpClient:
+    def __init__(self, domain):
+        self.domain = domain
+
+    def get(self, path, json=None):
+        return requests.get(self.domain + path, json=json)
+
+    def post(self, path, json=None):
+        return requests.post(self.domain + path, json=json)
+
+    def patch(self, path, json=None):
+        return requests.patch(self.domain + path, json=json)
+
+
+class InProcessResponse:
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.data = response.get_data()
+        self.text = self.data.decode()
+
+    def json(self):
+        return json_module.loads(self.data)
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path, json=None):
+        return InProcessResponse(self.client.get(path, json=json))
+
+    def post(self, path, json=None):
+        return InProcessResponse(self.client.post(path, json=json))
+
+    def patch(self, path, json=None):
+        return InProcessResponse(self.client.patch(path, json=json))
+
+
 class Tester:
-    def __init__(self):
+    def __init__(self, client):
+        self.client = client
         self.test_results = []
         self.exceptions = []
         self.connection_failed = False
@@ -44,7 +89,7 @@ class Tester:
             print('\nConnection error occurred. Maybe you forgot to run the server?')
 
     def test_couriers_post(self):
-        url = DOMAIN + '/couriers'
+        url = '/couriers'
 
         couriers_empty = []
         couriers_all_valid = [
@@ -82,26 +127,37 @@ class Tester:
             {'courier_type': 'car', 'regions': [6, 15], 'working_hours': ['09:00-18:00']},
         ]
 
-        response = requests.post(url, json={'data': couriers_empty})
+        response = self.client.post(url, json={'data': couriers_empty})
         assert response.status_code == HTTPStatus.CREATED
         assert response.json() == {'couriers': []}
 
-        response = requests.post(url, json={'data': couriers_all_valid})
+        response = self.client.post(url, json={'data': couriers_all_valid})
         assert response.status_code == HTTPStatus.CREATED
         assert response.json() == {'couriers': [{'id': 1}, {'id': 2}, {'id': 3}]}
 
-        response = requests.post(url, json={'data': couriers_some_invalid})
+        response = self.client.post(url, json={'data': couriers_some_invalid})
         assert response.status_code == HTTPStatus.BAD_REQUEST
         assert [element['id'] for element in response.json()['validation_error']['couriers']] == [
             101, 102, 103, 104, 105, 106, 107, 108, 109, 110, 111, 112, None
         ]
 
+        # the last entry of a repeated id wins
+        response = self.client.post(url, json={'data': [
+            {'courier_id': 5, 'courier_type': 'foot', 'regions': [8], 'working_hours': ['09:00-18:00']},
+            {'courier_id': 5, 'courier_type': 'car', 'regions': [9], 'working_hours': ['00:00-23:59']}
+        ]})
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {'couriers': [{'id': 5}, {'id': 5}]}
+        assert self.client.patch('/couriers/5', json={}).json() == {
+            'courier_id': 5, 'courier_type': 'car', 'regions': [9], 'working_hours': ['00:00-23:59']
+        }
+
         # invalid post format
-        response = requests.post(url, json={'couriers': couriers_all_valid})
+        response = self.client.post(url, json={'couriers': couriers_all_valid})
         assert response.status_code == HTTPStatus.BAD_REQUEST
 
     def test_couriers_patch(self):
-        url = DOMAIN + '/couriers/2'
+        url = '/couriers/2'
 
         patch_empty = {}
         patch_courier_type = {'courier_type': 'foot'}
@@ -112,56 +168,56 @@ class Tester:
         patch_id = {'id': 546}
         patch_undocumented = {'name': 'Bob'}
 
-        response = requests.patch(url, json=patch_empty)
+        response = self.client.patch(url, json=patch_empty)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'bike', 'regions': [22], 'working_hours': ['09:00-18:00']
         }
 
-        response = requests.patch(url, json=patch_courier_type)
+        response = self.client.patch(url, json=patch_courier_type)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'foot', 'regions': [22], 'working_hours': ['09:00-18:00']
         }
 
-        response = requests.patch(url, json=patch_regions)
+        response = self.client.patch(url, json=patch_regions)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'foot', 'regions': [11, 33, 2], 'working_hours': ['09:00-18:00']
         }
 
-        response = requests.patch(url, json=patch_working_hours)
+        response = self.client.patch(url, json=patch_working_hours)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'foot', 'regions': [11, 33, 2],
             'working_hours': ['00:00-11:59', '12:00-23:59']
         }
 
-        response = requests.patch(url, json=patch_2_fields)
+        response = self.client.patch(url, json=patch_2_fields)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'foot', 'regions': [1, 2, 3], 'working_hours': ['00:00-12:34']
         }
 
-        response = requests.patch(url, json=patch_3_fields)
+        response = self.client.patch(url, json=patch_3_fields)
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {
             'courier_id': 2, 'courier_type': 'bike', 'regions': [22], 'working_hours': ['09:00-18:00']
         }
 
-        response = requests.patch(url, json=patch_id)
+        response = self.client.patch(url, json=patch_id)
         assert response.status_code == HTTPStatus.BAD_REQUEST
 
-        response = requests.patch(url, json=patch_undocumented)
+        response = self.client.patch(url, json=patch_undocumented)
         assert response.status_code == HTTPStatus.BAD_REQUEST
 
-        invalid_url = DOMAIN + '/couriers/1000'
+        invalid_url = '/couriers/1000'
 
-        response = requests.patch(invalid_url, json=patch_3_fields)
+        response = self.client.patch(invalid_url, json=patch_3_fields)
         assert response.status_code == HTTPStatus.NOT_FOUND
 
     def test_orders_post(self):
-        url = DOMAIN + '/orders'
+        url = '/orders'
 
         orders_empty = []
         orders_all_valid = [
@@ -204,29 +260,39 @@ class Tester:
             {'weight': 1.23, 'region': 7, 'delivery_hours': ['09:00-18:00']},
         ]
 
-        response = requests.post(url, json={'data': orders_empty})
+        response = self.client.post(url, json={'data': orders_empty})
         assert response.status_code == HTTPStatus.CREATED
         assert response.json() == {'orders': []}
 
-        response = requests.post(url, json={'data': orders_all_valid})
+        response = self.client.post(url, json={'data': orders_all_valid})
         assert response.status_code == HTTPStatus.CREATED
         assert response.json() == {'orders': [{'id': 1}, {'id': 2}, {'id': 3}, {'id': 4}]}
 
-        response = requests.post(url, json={'data': orders_some_invalid})
+        response = self.client.post(url, json={'data': orders_some_invalid})
         assert response.status_code == HTTPStatus.BAD_REQUEST
 
         assert [element['id'] for element in response.json()['validation_error']['orders']] == [
             101, 102, 103, 104, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114, 115, 116, None
         ]
 
+        # the last entry of a repeated id wins
+        response = self.client.post(url, json={'data': [
+            {'order_id': 5, 'weight': 1, 'region': 8, 'delivery_hours': ['09:00-18:00']},
+            {'order_id': 5, 'weight': 1, 'region': 9, 'delivery_hours': ['09:00-18:00']}
+        ]})
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {'orders': [{'id': 5}, {'id': 5}]}
+        response = self.client.post('/orders/assign', json={'courier_id': 5})
+        assert [order['id'] for order in response.json()['orders']] == [5]
+
         # invalid post format
-        response = requests.post(url, json={'orders': orders_all_valid})
+        response = self.client.post(url, json={'orders': orders_all_valid})
         assert response.status_code == HTTPStatus.BAD_REQUEST
 
     def test_order_assign(self):
-        url = DOMAIN + '/orders/assign'
+        url = '/orders/assign'
 
-        requests.post(DOMAIN + '/orders', json={
+        self.client.post('/orders', json={
             'data': [
                 {'order_id': 400, 'weight': 1.00, 'region': 1, 'delivery_hours': ['00:00-23:59']},
                 {'order_id': 401, 'weight': 10.1, 'region': 1, 'delivery_hours': ['00:00-23:59']},
@@ -243,7 +309,7 @@ class Tester:
             ]
         })
 
-        requests.post(DOMAIN + '/couriers', json={
+        self.client.post('/couriers', json={
             'data': [
                 {'courier_id': 400, 'courier_type': 'foot', 'regions': [1], 'working_hours': ['09:00-21:00']},
                 {'courier_id': 401, 'courier_type': 'foot', 'regions': [1, 2], 'working_hours': ['09:00-21:00']},
@@ -255,76 +321,76 @@ class Tester:
             ]
         })
 
-        response = requests.post(url, json={'courier_id': 400})
+        response = self.client.post(url, json={'courier_id': 400})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [400, 407, 408]
         assert 'assigned_time' in response.json()
         idempotent_time_test = response.json()['assigned_time']
 
-        response = requests.post(url, json={'courier_id': 400})
+        response = self.client.post(url, json={'courier_id': 400})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [400, 407, 408]
         assert 'assigned_time' in response.json()
         assert response.json()['assigned_time'] == idempotent_time_test
 
-        response = requests.post(url, json={'courier_id': 401})
+        response = self.client.post(url, json={'courier_id': 401})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [404]
         assert 'assigned_time' in response.json()
 
-        response = requests.post(url, json={'courier_id': 402})
+        response = self.client.post(url, json={'courier_id': 402})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [405]
         assert 'assigned_time' in response.json()
 
-        response = requests.post(url, json={'courier_id': 403})
+        response = self.client.post(url, json={'courier_id': 403})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [409, 410]
         assert 'assigned_time' in response.json()
 
-        response = requests.post(url, json={'courier_id': 404})
+        response = self.client.post(url, json={'courier_id': 404})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == []
         assert 'assigned_time' not in response.json()
 
-        response = requests.post(url, json={'courier_id': 405})
+        response = self.client.post(url, json={'courier_id': 405})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [401]
         assert 'assigned_time' in response.json()
 
-        response = requests.post(url, json={'courier_id': 406})
+        response = self.client.post(url, json={'courier_id': 406})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [402, 406]
         assert 'assigned_time' in response.json()
 
     def test_order_complete(self):
-        url = DOMAIN + '/orders/complete'
+        url = '/orders/complete'
 
-        assert requests.post(url, json={
+        assert self.client.post(url, json={
             'courier_id': 500,
             'order_id': 406,
             'complete_time': '2021-01-10T10:33:01.42Z'
         }).status_code == HTTPStatus.BAD_REQUEST
 
-        assert requests.post(url, json={
+        assert self.client.post(url, json={
             'courier_id': 406,
             'order_id': 500,
             'complete_time': '2021-01-10T10:33:01.42Z'
         }).status_code == HTTPStatus.BAD_REQUEST
 
-        assert requests.post(url, json={
+        assert self.client.post(url, json={
             'courier_id': 406,
             'order_id': 400,
             'complete_time': '2021-01-10T10:33:01.42Z'
         }).status_code == HTTPStatus.BAD_REQUEST
 
-        assert requests.post(url, json={
+        assert self.client.post(url, json={
             'courier_id': 406,
             'order_id': 406,
             'complete_time': '2021-01-10T10:33:01.42Z'
         }).status_code == HTTPStatus.BAD_REQUEST
 
-        response = requests.post(url, json={
+        response = self.client.post(url, json={
             'courier_id': 406,
             'order_id': 406,
             'complete_time': current_timestamp()
@@ -332,15 +398,123 @@ class Tester:
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {'order_id': 406}
 
-        response = requests.post(DOMAIN + '/orders/assign', json={'courier_id': 406})
+        response = self.client.post('/orders/assign', json={'courier_id': 406})
         assert response.status_code == HTTPStatus.OK
         assert sorted([order['id'] for order in response.json()['orders'] if order['id'] >= 400]) == [402]
         assert 'assigned_time' in response.json()
 
+    def test_order_assign_wait(self):
+        url = '/orders/assign'
+
+        assert self.client.post(url + '?wait=61', json={'courier_id': 406}).status_code == HTTPStatus.BAD_REQUEST
+        assert self.client.post(url + '?wait=soon', json={'courier_id': 406}).status_code == HTTPStatus.BAD_REQUEST
+
+        self.client.post('/couriers', json={'data': [
+            {'courier_id': 500, 'courier_type': 'foot', 'regions': [50], 'working_hours': ['00:00-23:59']}
+        ]})
+
+        start = time.monotonic()
+        response = self.client.post(url + '?wait=0.5', json={'courier_id': 500})
+        assert response.status_code == HTTPStatus.OK
+        assert response.json() == {'orders': []}
+        assert time.monotonic() - start >= 0.5
+
+        responses = []
+        waiter = threading.Thread(target=lambda: responses.append(
+            self.client.post(url + '?wait=30', json={'courier_id': 500})
+        ))
+        start = time.monotonic()
+        waiter.start()
+        time.sleep(0.3)
+        self.client.post('/orders', json={'data': [
+            {'order_id': 500, 'weight': 1, 'region': 50, 'delivery_hours': ['00:00-23:59']}
+        ]})
+        waiter.join()
+
+        assert time.monotonic() - start < 10
+        assert responses[0].status_code == HTTPStatus.OK
+        assert [order['id'] for order in responses[0].json()['orders']] == [500]
+
+        # couriers that find the same order race for it, the ones that lose it wait out their time;
+        # the race is run a few times, each in a region of its own
+        def assign(courier_id):
+            start.wait()
+            responses[courier_id] = self.client.post(url + '?wait=0.3', json={'courier_id': courier_id})
+
+        for region in range(51, 55):
+            courier_ids = range(region * 100, region * 100 + 16)
+            self.client.post('/couriers', json={'data': [
+                {'courier_id': courier_id, 'courier_type': 'foot', 'regions': [region],
+                 'working_hours': ['00:00-23:59']}
+                for courier_id in courier_ids
+            ]})
+            self.client.post('/orders', json={'data': [
+                {'order_id': region * 100, 'weight': 1, 'region': region, 'delivery_hours': ['00:00-23:59']}
+            ]})
+
+            responses = {}
+            start = threading.Barrier(len(courier_ids))
+            waiters = [threading.Thread(target=assign, args=(courier_id,)) for courier_id in courier_ids]
+            for waiter in waiters:
+                waiter.start()
+            for waiter in waiters:
+                waiter.join()
+
+            assert [response.status_code for response in responses.values()] == [HTTPStatus.OK] * len(courier_ids)
+            assert [order['id'] for response in responses.values() for order in response.json()['orders']] == \
+                   [region * 100]
+
+    def test_orders_post_large(self):
+        url = '/orders'
+
+        # more orders than are stored in one chunk, with an invalid one in the second chunk
+        orders = [{'order_id': order_id, 'weight': 1, 'region': 60, 'delivery_hours': ['00:00-23:59']}
+                  for order_id in range(1000, 1600)]
+        orders_some_invalid = orders[:550] + [dict(orders[550], weight=0)] + orders[551:]
+
+        response = self.client.post(url, json={'data': orders_some_invalid})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert [element['id'] for element in response.json()['validation_error']['orders']] == [1550]
+
+        self.client.post('/couriers', json={'data': [
+            {'courier_id': 600, 'courier_type': 'car', 'regions': [60], 'working_hours': ['00:00-23:59']}
+        ]})
+        response = self.client.post('/orders/assign', json={'courier_id': 600})
+        assert sorted(order['id'] for order in response.json()['orders']) == \
+               [order['order_id'] for order in orders if order['order_id'] != 1550]
+
+        response = self.client.post(url, json={'data': orders})
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {'orders': [{'id': order['order_id']} for order in orders]}
+
+        response = self.client.post('/orders/assign', json={'courier_id': 600})
+        assert sorted(order['id'] for order in response.json()['orders']) == [order['order_id'] for order in orders]
+
+    def test_couriers_report(self):
+        url = '/reports/couriers'
+
+        assert self.client.get(url + '?format=xml').status_code == HTTPStatus.BAD_REQUEST
+
+        response = self.client.get(url + '?format=ndjson')
+        assert response.status_code == HTTPStatus.OK
+        report = {row['courier_id']: row for row in map(json_module.loads, response.text.splitlines())}
+
+        courier = self.client.get('/couriers/406').json()
+        assert report[406]['rating'] == courier['rating']
+        assert report[406]['earnings'] == courier['earnings']
+        assert report[400]['rating'] is None
+        assert report[400]['earnings'] == 0
+
+        response = self.client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        lines = response.text.splitlines()
+        assert lines[0] == 'courier_id,courier_type,rating,earnings'
+        assert len(lines) == len(report) + 1
+
     def test_couriers_get(self):
-        url = DOMAIN + '/couriers/406'
+        url = '/couriers/406'
 
-        response = requests.get(url)
+        response = self.client.get(url)
         assert response.status_code == HTTPStatus.OK
 
     def test(self):
@@ -349,11 +523,37 @@ class Tester:
         self.make_test(self.test_orders_post)
         self.make_test(self.test_order_assign)
         self.make_test(self.test_order_complete)
+        self.make_test(self.test_order_assign_wait)
+        self.make_test(self.test_orders_post_large)
+        self.make_test(self.test_couriers_report)
         self.make_test(self.test_couriers_get)
 
         self.print_stats()
 
 
 if __name__ == '__main__':
-    t = Tester()
+    if '--in-process' in sys.argv:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        from src.app import create_app
+        from src.models import db
+
+        # A database file rather than an in-memory one, whose single connection would be shared by
+        # the sessions of concurrent requests and mix their transactions together.
+        directory = tempfile.TemporaryDirectory()
+        app = create_app({
+            'TESTING': True,
+            'DB_BACKEND': 'sqlite',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory.name, 'test.db'),
+            'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'check_same_thread': False, 'timeout': 30}},
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+            'GROUP_COMMIT_WINDOW': 5 if '--group-commit' in sys.argv else None
+        })
+        with app.app_context():
+            db.create_all()
+        test_client = InProcessClient(app)
+    else:
+        test_client = HttpClient(DOMAIN)
+
+    t = Tester(test_client)
     t.test()
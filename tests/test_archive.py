@@ -0,0 +1,130 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json  # noqa: E402
+from http import HTTPStatus  # noqa: E402
+
+from src.app import create_app  # noqa: E402
+from src.archiver import archive_orders  # noqa: E402
+from src.models import Order, ArchivedOrder  # noqa: E402
+from src.storage import get_storage  # noqa: E402
+
+
+def make_app():
+    return create_app({
+        'TESTING': True,
+        'DB_BACKEND': 'sqlite',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False
+    })
+
+
+def archive(app):
+    with app.app_context():
+        return archive_orders(get_storage(), batch_size=1000)
+
+
+def stored_order_ids(app, model):
+    with app.app_context():
+        return sorted(order.order_id for order in model.query.all())
+
+
+def courier_report(client):
+    response = client.get('/reports/couriers?format=ndjson')
+    assert response.status_code == HTTPStatus.OK
+    return {row['courier_id']: row for row in map(json.loads, response.get_data(as_text=True).splitlines())}
+
+
+def complete(client, courier_id, order_id, complete_time):
+    return client.post('/orders/complete', json={
+        'courier_id': courier_id, 'order_id': order_id, 'complete_time': complete_time
+    })
+
+
+def make_deliveries(app):
+    client = app.test_client()
+    client.post('/couriers', json={'data': [
+        {'courier_id': 1, 'courier_type': 'foot', 'regions': [1], 'working_hours': ['00:00-23:59']},
+        {'courier_id': 2, 'courier_type': 'foot', 'regions': [2], 'working_hours': ['00:00-23:59']}
+    ]}).get_data()
+    client.post('/orders', json={'data': [
+        {'order_id': order_id, 'weight': 1, 'region': 1, 'delivery_hours': ['00:00-23:59']}
+        for order_id in (1, 2, 3)
+    ]}).get_data()
+
+    assigned_time = client.post('/orders/assign', json={'courier_id': 1}).get_json()['assigned_time']
+    assert complete(client, 1, 1, assigned_time).status_code == HTTPStatus.OK
+    assert complete(client, 1, 2, assigned_time).status_code == HTTPStatus.OK
+    return client, assigned_time
+
+
+def test_archive_skips_undelivered_batches():
+    app = make_app()
+    client, assigned_time = make_deliveries(app)
+
+    assert archive(app) == 0
+    assert stored_order_ids(app, Order) == [1, 2, 3]
+
+    assert complete(client, 1, 3, assigned_time).status_code == HTTPStatus.OK
+    assert archive(app) == 3
+    assert stored_order_ids(app, Order) == []
+    assert stored_order_ids(app, ArchivedOrder) == [1, 2, 3]
+
+
+def test_archived_orders_count_in_stats():
+    app = make_app()
+    client, assigned_time = make_deliveries(app)
+    complete(client, 1, 3, assigned_time)
+
+    courier = client.get('/couriers/1').get_json()
+    report = courier_report(client)
+    assert archive(app) == 3
+
+    assert client.get('/couriers/1').get_json() == courier
+    assert courier_report(client) == report
+    assert report[1]['rating'] == courier['rating']
+    assert report[1]['earnings'] == courier['earnings'] > 0
+
+
+def test_complete_archived_order():
+    app = make_app()
+    client, assigned_time = make_deliveries(app)
+    complete(client, 1, 3, assigned_time)
+    archive(app)
+    courier = client.get('/couriers/1').get_json()
+
+    response = complete(client, 1, 3, '2030-01-01T00:00:00.00Z')
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json() == {'order_id': 3}
+    assert client.get('/couriers/1').get_json() == courier
+    assert stored_order_ids(app, Order) == []
+
+    assert complete(client, 2, 3, assigned_time).status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_repost_archived_order():
+    app = make_app()
+    client, assigned_time = make_deliveries(app)
+    complete(client, 1, 3, assigned_time)
+    archive(app)
+
+    response = client.post('/orders', json={'data': [
+        {'order_id': 1, 'weight': 2, 'region': 2, 'delivery_hours': ['00:00-23:59']}
+    ]})
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.get_json() == {'orders': [{'id': 1}]}
+    assert stored_order_ids(app, Order) == [1]
+    assert stored_order_ids(app, ArchivedOrder) == [2, 3]
+
+    response = client.post('/orders/assign', json={'courier_id': 2})
+    assert [order['id'] for order in response.get_json()['orders']] == [1]
+
+
+if __name__ == '__main__':
+    test_archive_skips_undelivered_batches()
+    test_archived_orders_count_in_stats()
+    test_complete_archived_order()
+    test_repost_archived_order()
+    print('Archive tests passed')
@@ -0,0 +1,139 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random  # noqa: E402
+
+from src.engine import Dispatcher, DispatchError, TimeWindowSet, time_ranges_intersect  # noqa: E402
+
+
+def minutes(time_intervals):
+    minutes_array = []
+    for time_interval in time_intervals:
+        start_time, end_time = time_interval.split('-')
+        start_hours, start_minutes = start_time.split(':')
+        end_hours, end_minutes = end_time.split(':')
+        minutes_array.append([int(start_hours) * 60 + int(start_minutes), int(end_hours) * 60 + int(end_minutes)])
+    return minutes_array
+
+
+def make_dispatcher():
+    dispatcher = Dispatcher()
+
+    for order_id, weight, region, delivery_hours in [
+        (400, 1.00, 1, ['00:00-23:59']),
+        (401, 10.1, 1, ['00:00-23:59']),
+        (402, 15.1, 1, ['00:00-23:59']),
+        (403, 50.1, 1, ['00:00-23:59']),
+        (404, 1.00, 2, ['00:00-23:59']),
+        (405, 1.00, 3, ['00:00-23:59']),
+        (406, 1.00, 4, ['00:00-23:59']),
+        (407, 1.00, 1, ['12:00-23:59']),
+        (408, 1.00, 1, ['09:30-13:00', '14:00-18:00']),
+        (409, 1.00, 1, ['01:00-02:00', '22:00-00:30']),
+        (410, 1.00, 1, ['21:30-08:30']),
+        (411, 1.00, 1, ['21:01-21:01']),
+    ]:
+        dispatcher.add_order(order_id, weight, region, minutes(delivery_hours))
+
+    for courier_id, courier_type, regions, working_hours in [
+        (400, 'foot', [1], ['09:00-21:00']),
+        (401, 'foot', [1, 2], ['09:00-21:00']),
+        (402, 'foot', [1, 3], ['09:00-21:00']),
+        (403, 'foot', [1, 2, 3], ['23:00-00:05']),
+        (404, 'foot', [1, 2, 3], ['23:59-00:00']),
+        (405, 'bike', [1, 2, 3], ['09:00-21:00']),
+        (406, 'car', [1, 2, 3, 4], ['09:00-21:00']),
+    ]:
+        dispatcher.add_courier(courier_id, courier_type, regions, minutes(working_hours))
+
+    return dispatcher
+
+
+def assigned_ids(orders):
+    return sorted(order.order_id for order in orders)
+
+
+def test_time_ranges_intersect():
+    assert time_ranges_intersect([540, 1260], [720, 1439])
+    assert time_ranges_intersect([1380, 5], [1320, 30])
+    assert not time_ranges_intersect([540, 1260], [1261, 1300])
+
+
+def test_time_window_set():
+    hours = TimeWindowSet.parse(['22:00-00:30', '01:00-02:00', '01:30-03:00'])
+    assert hours.windows == ((0, 30), (60, 180), (1320, 1439))
+    assert hours.time_intervals == ('22:00-00:30', '01:00-02:00', '01:30-03:00')
+    assert TimeWindowSet(hours.periods).time_intervals == hours.time_intervals
+
+    assert hours.intersects(TimeWindowSet.parse(['23:59-23:59']))
+    assert hours.intersects(TimeWindowSet.parse(['23:00-00:05']))
+    assert not hours.intersects(TimeWindowSet.parse(['00:31-00:59', '03:01-21:59']))
+    assert not hours.intersects(TimeWindowSet())
+
+    # Matching must agree with comparing every pair of periods.
+    rng = random.Random(0)
+    for _ in range(2000):
+        periods1 = [[rng.randrange(1440), rng.randrange(1440)] for _ in range(rng.randint(1, 3))]
+        periods2 = [[rng.randrange(1440), rng.randrange(1440)] for _ in range(rng.randint(1, 3))]
+        expected = any(time_ranges_intersect(period1, period2) for period1 in periods1 for period2 in periods2)
+        assert TimeWindowSet(periods1).intersects(TimeWindowSet(periods2)) == expected
+
+
+def test_assign_orders():
+    dispatcher = make_dispatcher()
+
+    assert assigned_ids(dispatcher.assign_orders(400, current_time=0)) == [400, 407, 408]
+    assert assigned_ids(dispatcher.assign_orders(400, current_time=100)) == [400, 407, 408]
+    assert {order.assigned_time for order in dispatcher.get_remaining_orders(400)} == {0}
+
+    assert assigned_ids(dispatcher.assign_orders(401, current_time=0)) == [404]
+    assert assigned_ids(dispatcher.assign_orders(402, current_time=0)) == [405]
+    assert assigned_ids(dispatcher.assign_orders(403, current_time=0)) == [409, 410]
+    assert assigned_ids(dispatcher.assign_orders(404, current_time=0)) == []
+    assert assigned_ids(dispatcher.assign_orders(405, current_time=0)) == [401]
+    assert assigned_ids(dispatcher.assign_orders(406, current_time=0)) == [402, 406]
+
+
+def test_patch_courier_releases_orders():
+    dispatcher = make_dispatcher()
+    dispatcher.assign_orders(400, current_time=0)
+
+    dispatcher.patch_courier(400, working_hours=minutes(['09:00-11:00']))
+
+    assert assigned_ids(dispatcher.get_remaining_orders(400)) == [400, 408]
+    assert 407 in assigned_ids(dispatcher.get_suitable_orders(405))
+
+
+def test_complete_orders():
+    dispatcher = make_dispatcher()
+    dispatcher.assign_orders(406, current_time=1000)
+
+    try:
+        dispatcher.complete_order(406, 403, complete_time=2000)
+        assert False
+    except DispatchError:
+        pass
+
+    try:
+        dispatcher.complete_order(406, 406, complete_time=500)
+        assert False
+    except DispatchError:
+        pass
+
+    assert dispatcher.complete_order(406, 406, complete_time=1600).delivery_time == 600
+    assert dispatcher.complete_order(406, 402, complete_time=2500).delivery_time == 900
+    assert dispatcher.complete_order(406, 402, complete_time=9999).delivery_time == 900
+
+    assert dispatcher.get_rating(406) == (3600 - 600) / 3600 * 5
+    assert dispatcher.get_earnings(406) == 2 * 500 * 9
+
+
+if __name__ == '__main__':
+    test_time_ranges_intersect()
+    test_time_window_set()
+    test_assign_orders()
+    test_patch_courier_releases_orders()
+    test_complete_orders()
+    print('Engine tests passed')
@@ -0,0 +1,185 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile  # noqa: E402
+from http import HTTPStatus  # noqa: E402
+
+from sqlalchemy import select  # noqa: E402
+
+from src.app import create_app  # noqa: E402
+from src.archiver import archive_orders  # noqa: E402
+from src.models import db, Courier, Order, ArchivedOrder  # noqa: E402
+from src.sharding import rebalance  # noqa: E402
+
+REGIONS = list(range(1, 7))
+
+
+def make_app(directory, region_map=None):
+    app = create_app({
+        'TESTING': True,
+        'DB_BACKEND': 'sqlite',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'main.db'),
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'check_same_thread': False}},
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SHARD_DATABASE_URIS': ['sqlite:///' + os.path.join(directory, 'shard1.db')],
+        'SHARD_REGION_MAP': region_map
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def get_router(app):
+    return app.extensions['storage'].router
+
+
+def shard_rows(app, table, *columns):
+    rows = []
+    for engine in get_router(app).engines:
+        with engine.connect() as connection:
+            rows.append(sorted(tuple(row) for row in connection.execute(
+                select(*[table.c[column] for column in columns])
+            )))
+    return rows
+
+
+def stored_order_ids(app, table):
+    return sorted(order_id for rows in shard_rows(app, table, 'order_id') for order_id, in rows)
+
+
+def post_orders(client, order_ids, region):
+    response = client.post('/orders', json={'data': [
+        {'order_id': order_id, 'weight': 1, 'region': region, 'delivery_hours': ['00:00-23:59']}
+        for order_id in order_ids
+    ]})
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.get_json() == {'orders': [{'id': order_id} for order_id in order_ids]}
+
+
+def test_requests_across_shards():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(directory)
+        client = app.test_client()
+
+        response = client.post('/couriers', json={'data': [
+            {'courier_id': 1, 'courier_type': 'foot', 'regions': [1, 2], 'working_hours': ['00:00-23:59']}
+        ]})
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.get_json() == {'couriers': [{'id': 1}]}
+        post_orders(client, [1], region=1)
+        post_orders(client, [2], region=2)
+        assert shard_rows(app, Order.__table__, 'order_id') == [[(2,)], [(1,)]]
+        assert shard_rows(app, Courier.__table__, 'courier_id') == [[(1,)], [(1,)]]
+
+        response = client.post('/orders/assign', json={'courier_id': 1})
+        assert response.status_code == HTTPStatus.OK
+        assert sorted(order['id'] for order in response.get_json()['orders']) == [1, 2]
+        assigned_time = response.get_json()['assigned_time']
+
+        response = client.patch('/couriers/1', json={'regions': [2]})
+        assert response.status_code == HTTPStatus.OK
+        assert response.get_json()['regions'] == [2]
+        assert shard_rows(app, Courier.__table__, 'courier_id', 'regions') == [[(1, [2])], [(1, [2])]]
+        assert shard_rows(app, Order.__table__, 'order_id', 'assigned_courier_id') == [[(2, 1)], [(1, None)]]
+
+        response = client.post('/orders/complete', json={
+            'courier_id': 1, 'order_id': 2, 'complete_time': assigned_time
+        })
+        assert response.status_code == HTTPStatus.OK
+        assert client.post('/orders/complete', json={
+            'courier_id': 1, 'order_id': 1, 'complete_time': assigned_time
+        }).status_code == HTTPStatus.BAD_REQUEST
+
+        response = client.get('/couriers/1')
+        assert response.status_code == HTTPStatus.OK
+        assert response.get_json()['earnings'] > 0
+        assert 'rating' in response.get_json()
+
+
+def test_courier_replacement():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(directory)
+        client = app.test_client()
+
+        for courier_type, regions in [('foot', [1, 2]), ('car', [3])]:
+            response = client.post('/couriers', json={'data': [
+                {'courier_id': 1, 'courier_type': courier_type, 'regions': regions, 'working_hours': ['09:00-18:00']}
+            ]})
+            assert response.status_code == HTTPStatus.CREATED
+            response.get_data()
+
+        assert shard_rows(app, Courier.__table__, 'courier_id', 'courier_type', 'regions') == \
+               [[(1, 'car', [3])], [(1, 'car', [3])]]
+        response = client.patch('/couriers/1', json={})
+        assert response.get_json()['courier_type'] == 'car'
+
+
+def test_rebalance():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(directory)
+        client = app.test_client()
+        client.post('/couriers', json={'data': [
+            {'courier_id': 1, 'courier_type': 'car', 'regions': REGIONS, 'working_hours': ['00:00-23:59']}
+        ]}).get_data()
+        for region in REGIONS:
+            post_orders(client, [region * 10 + 1], region=region)
+        assigned_time = client.post('/orders/assign', json={'courier_id': 1}).get_json()['assigned_time']
+        for region in REGIONS:
+            client.post('/orders/complete', json={
+                'courier_id': 1, 'order_id': region * 10 + 1, 'complete_time': assigned_time
+            })
+
+        for region in REGIONS:
+            post_orders(client, [region * 10 + 2], region=region)
+        client.post('/orders/assign', json={'courier_id': 1})
+        # Re-posted orders move to the shard of their new region.
+        post_orders(client, [region * 10 + 3 for region in REGIONS], region=1)
+        for region in REGIONS:
+            post_orders(client, [region * 10 + 3], region=region)
+
+        with app.app_context():
+            for shard in app.extensions['storage'].shards():
+                archive_orders(shard)
+                shard.release()
+        assert stored_order_ids(app, ArchivedOrder.__table__) == [region * 10 + 1 for region in REGIONS]
+
+        # A courier only in the main database, as if a shard was added after it was imported.
+        with get_router(app).engines[0].begin() as connection:
+            connection.execute(Courier.__table__.insert(), [
+                {'courier_id': 2, 'courier_type': 'foot', 'regions': [1], 'working_hours': [[600, 660]]}
+            ])
+        rating = client.get('/couriers/1').get_json()
+
+        region_map = {region: (region + 1) % 2 for region in REGIONS}
+        app = make_app(directory, region_map=region_map)
+        router = get_router(app)
+        assert rebalance(router, batch_size=2) > 0
+
+        for table in (Order.__table__, ArchivedOrder.__table__):
+            shards = shard_rows(app, table, 'order_id', 'region')
+            order_ids = [order_id for rows in shards for order_id, region in rows]
+            assert len(order_ids) == len(set(order_ids))
+            for shard_id, rows in enumerate(shards):
+                assert all(router.shard_for_region(region) == shard_id for order_id, region in rows)
+        assert stored_order_ids(app, Order.__table__) == \
+               sorted(region * 10 + suffix for region in REGIONS for suffix in (2, 3))
+
+        couriers = shard_rows(app, Courier.__table__, 'courier_id', 'courier_type', 'regions', 'working_hours')
+        assert couriers[0] == couriers[1]
+        assert [row[0] for row in couriers[1]] == [1, 2]
+        assert rebalance(router, batch_size=2) == 0
+
+        client = app.test_client()
+        assert client.get('/couriers/1').get_json() == rating
+        response = client.post('/orders/assign', json={'courier_id': 1})
+        assert sorted(order['id'] for order in response.get_json()['orders']) == \
+               sorted(region * 10 + 2 for region in REGIONS)
+
+
+if __name__ == '__main__':
+    test_requests_across_shards()
+    test_courier_replacement()
+    test_rebalance()
+    print('Sharding tests passed')